@@ -1,10 +1,25 @@
-from flask import Flask, render_template, request, flash, redirect, url_for, session
+from flask import Flask, render_template, request, flash, redirect, url_for, session, send_from_directory, abort, make_response, stream_with_context, jsonify
 from flask_wtf import CSRFProtect
 from flask_wtf.csrf import generate_csrf
+import csv
+import gzip
+import hashlib
+import io
+import json
 import os
+import sqlite3
 from werkzeug.utils import secure_filename
 from db.db import *
+from db.migrate import migrate
+from db.slowlog import enable_slow_query_log
+from images import image_sources, process_upload
+from catalog_io import FORMATS, detect_format, export_products_text, import_products
+from assets import IMMUTABLE_CACHE_CONTROL, asset_url, fingerprint
+import metrics
+import suggest
+from datetime import date, datetime, timedelta, timezone
 from functools import wraps
+from jinja2 import FileSystemBytecodeCache
 
 app = Flask(__name__)
 
@@ -16,6 +31,10 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "webp"}
 
+# Product listings (home page, /products/)
+PAGE_SIZE = 12
+MAX_PAGE_SIZE = 60
+
 def allowed_file(filename: str) -> bool:
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -24,6 +43,44 @@ def allowed_file(filename: str) -> bool:
 app.secret_key = "your_secret_key"
 csrf = CSRFProtect(app)
 
+# Bring the schema (tables, indexes) up to date before serving
+migrate()
+
+# With STUDENTMART_SLOW_QUERY_MS set, slower statements go to
+# db/slow_queries.log with their query plan; summarize with
+# python -m db.slowlog. Off by default: it times every query.
+enable_slow_query_log()
+
+# STUDENTMART_CATALOG_SNAPSHOT=1: catalog reads come from an in-memory copy
+# of products and categories (see CatalogSnapshot), loaded here up front
+if catalog_snapshot.enabled:
+    catalog_snapshot.refresh()
+
+# One SQLite connection per request, closed when the app context ends
+app.teardown_appcontext(close_db_connection)
+
+# Per-route latency, SQL statement counts/time and connection opens,
+# served on /metrics (metrics.py). STUDENTMART_METRICS=0 turns it off.
+if metrics.ENABLED:
+    app.before_request(metrics.start_request)
+    app.after_request(metrics.finish_request)
+
+# Shown when password hashing (PasswordHashingBusy) or the write queue
+# (WriteQueueBusy) turns a request away
+BUSY_MESSAGE = "We're busy right now. Please try again in a moment."
+
+def flash_busy():
+    flash(category="warning", message=BUSY_MESSAGE)
+
+# STUDENTMART_WRITE_QUEUE=1 queues cart/checkout/account writes to one
+# group-commit writer (see GroupCommitWriter); when it is backed up, say so
+@app.errorhandler(WriteQueueBusy)
+def write_queue_busy(e):
+    if request.is_json:
+        return jsonify(error="busy, try again"), 503
+    flash_busy()
+    return redirect(request.referrer or url_for("index"))
+
 
 def admin_required(view):
     @wraps(view)
@@ -32,7 +89,14 @@ def admin_required(view):
             flash("Please login first.", "warning")
             return redirect(url_for("login"))
 
-        if not is_user_admin(session["user_id"]):
+        # The admin flag lives in the session and is re-read from users only
+        # after some user's role has changed (see get_role_epoch)
+        epoch = get_role_epoch()
+        if session.get("role_epoch") != epoch:
+            session["is_admin"] = is_user_admin(session["user_id"])
+            session["role_epoch"] = epoch
+
+        if not session["is_admin"]:
             flash("Admins only.", "danger")
             return redirect(url_for("index"))
 
@@ -40,36 +104,176 @@ def admin_required(view):
     return wrapped
 
 
-# CSRF token available in all templates 
+# Rendered catalog pages for anonymous visitors, keyed on path + query
+# string. Dropped when the catalog changes; the TTL covers other workers.
+# STUDENTMART_PAGE_CACHE=0 turns it off (ETags and 304s still apply).
+page_cache = CatalogCache(
+    maxsize=256,
+    ttl=30.0,
+    enabled=os.environ.get("STUDENTMART_PAGE_CACHE", "1") != "0",
+)
+
+@on_catalog_change
+def invalidate_pages(product_ids, category_ids):
+    if product_ids is None:  # bulk change
+        page_cache.clear()
+        return
+    product_pages = tuple(f"/product/{pid}/" for pid in product_ids)
+    page_cache.invalidate(
+        lambda key: key.startswith(product_pages) or key.startswith(("/?", "/products/"))
+    )
+
+def cached_page(view):
+    # Serves anonymous GETs from page_cache and tags every 200 HTML
+    # response with a strong ETag so If-None-Match can be answered with 304.
+    # Pages with pending flash messages are neither served from nor stored
+    # in the cache.
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        key = request.full_path
+        cacheable = (
+            page_cache.enabled
+            and session.get("user_id") is None
+            and not session.get("_flashes")
+        )
+        if cacheable:
+            cached = page_cache.get(key)
+            if cached is not None:
+                body, etag = cached
+                response = app.response_class(body, mimetype="text/html")
+                response.set_etag(etag)
+                return response.make_conditional(request)
+
+        response = make_response(view(*args, **kwargs))
+        if response.status_code != 200 or response.mimetype != "text/html":
+            return response
+        body = response.get_data()
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        response.set_etag(etag)
+        if cacheable and not session.get("_flashes"):
+            page_cache.set(key, (body, etag))
+        return response.make_conditional(request)
+    return wrapped
+
+
+# CSRF token available in all templates, as {{ csrf_token }}. It is only
+# generated (and stored in the session) when a template prints it, so
+# pages without forms don't touch the session. Still a context processor:
+# flask-wtf's own one would otherwise put its function in its place.
+class LazyCsrfToken:
+    def __html__(self):
+        return generate_csrf()  # once per request, flask-wtf keeps it on g
+
+    __str__ = __html__
+
+_csrf_token = LazyCsrfToken()
+
 @app.context_processor
 def inject_csrf_token():
-    return dict(csrf_token=generate_csrf())
+    return dict(csrf_token=_csrf_token)
 
 # Global variable for site name used in templates 
 siteName = "StudentMart"
-@app.context_processor
-def inject_site_name():
-    return dict(siteName=siteName)
+app.add_template_global(siteName, "siteName")
+
+# Compiled templates are kept on disk (STUDENTMART_JINJA_CACHE, default
+# .jinja_cache/ next to app.py; empty turns it off): a new worker loads
+# their bytecode instead of compiling them again
+JINJA_CACHE_DIR = os.environ.get("STUDENTMART_JINJA_CACHE", os.path.join(app.root_path, ".jinja_cache"))
+if JINJA_CACHE_DIR:
+    os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(JINJA_CACHE_DIR)
+
+# Resized/WebP image variants for product cards and pages (images.py)
+app.add_template_global(image_sources)
+
+# Templates get fingerprinted static URLs: url_for('static', filename=...)
+# resolves to /assets/<content hash>/... (assets.py)
+def fingerprinted_url_for(endpoint, **values):
+    if endpoint == "static" and len(values) == 1 and "filename" in values:
+        return asset_url(values["filename"])
+    return url_for(endpoint, **values)
+
+app.jinja_env.globals["url_for"] = fingerprinted_url_for
+
+
+def page_limit():
+    limit = request.args.get("limit", default=PAGE_SIZE, type=int) or PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def paginate(fetch, limit):
+    # Keyset pagination driven by ?after=<cursor> / ?before=<cursor>.
+    # fetch(n, after=, before=) returns up to n rows in display order; one
+    # extra row is requested to know whether another page exists.
+    after = request.args.get("after") or None
+    before = None if after else (request.args.get("before") or None)
+
+    rows = fetch(limit + 1, after=after, before=before)
+    if before:
+        has_prev, has_next = len(rows) > limit, True
+        rows = rows[-limit:]
+    else:
+        has_prev, has_next = after is not None, len(rows) > limit
+        rows = rows[:limit]
+
+    next_cursor = encode_cursor(rows[-1]) if rows and has_next else None
+    prev_cursor = encode_cursor(rows[0]) if rows and has_prev else None
+    return rows, next_cursor, prev_cursor
 
 
 # Pages
 
 @app.route("/")
+@cached_page
 def index():
     query = request.args.get("q", "").strip()
+    limit = page_limit()
 
     if query:
-        products = search_products(query, limit=12)
+        fetch = lambda n, **cursor: search_products(query, limit=n, **cursor)
     else:
-        products = get_all_products(limit=12)
-
-    return render_template("index.html", products=products)
+        fetch = lambda n, **cursor: get_all_products(limit=n, **cursor)
+    products, next_cursor, prev_cursor = paginate(fetch, limit)
+
+    return render_template("index.html", products=products,
+                           next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+# As-you-type suggestions for the search box, from the in-memory prefix
+# index in suggest.py (no SQL per keystroke)
+MAX_SUGGEST_QUERY = 100
+
+@app.route("/search/suggest")
+def search_suggest():
+    q = request.args.get("q", "")[:MAX_SUGGEST_QUERY]
+    items = suggest.suggest(q)
+    for item in items:
+        if item["type"] == "product":
+            item["url"] = url_for("product", id=item["id"])
+        else:
+            item["url"] = url_for("products", category=item["id"])
+    response = jsonify(q=q, suggestions=items)
+    response.cache_control.public = True
+    response.cache_control.max_age = 60
+    return response
 
 @app.route("/about")
 def about():
     return render_template("about.html", title="About")
 
 
+@app.route("/assets/<fingerprint_>/<path:filename>")
+def asset(fingerprint_, filename):
+    current = fingerprint(filename)
+    if current is None:
+        abort(404)
+    if current != fingerprint_:
+        # Stale link to a file that has since changed
+        return redirect(asset_url(filename))
+    response = send_from_directory(app.static_folder, filename)
+    response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
 # Auth (Register/Login/Logout)
 
 @app.route("/register/", methods=("GET", "POST"))
@@ -90,7 +294,11 @@ def register():
             error = "Username already exists! Please choose a different one."
 
         if error is None:
-            create_user(username, password)
+            try:
+                create_user(username, password)
+            except PasswordHashingBusy:
+                flash_busy()
+                return render_template("register.html", title="Register"), 503
             flash(category="success", message=f"Registration successful! Welcome {username}!")
             return redirect(url_for("login"))
 
@@ -111,13 +319,20 @@ def login():
             error = "Password is required!"
 
         if error is None:
-            user = validate_login(username, password)
+            role_epoch = get_role_epoch()  # read before the user row
+            try:
+                user = validate_login(username, password)
+            except PasswordHashingBusy:
+                flash_busy()
+                return render_template("login.html", title="Log In"), 503
             if user is None:
                 error = "Invalid username or password!"
             else:
                 session.clear()
                 session["user_id"] = user["id"]
                 session["username"] = user["username"]
+                session["is_admin"] = user["is_admin"] == 1
+                session["role_epoch"] = role_epoch
                 flash(category="success", message=f"Login successful! Welcome back {user['username']}!")
                 return redirect(url_for("index"))
 
@@ -135,19 +350,37 @@ def logout():
 # Products
 
 @app.route("/products/")
+@cached_page
 def products():
     category_id = request.args.get("category", default=None, type=int)
+    price_band = request.args.get("price", default=None, type=int)
+    if price_band is not None and not 0 <= price_band < len(PRICE_BANDS):
+        price_band = None
+    in_stock = request.args.get("in_stock") == "1"
     cats = get_all_categories()
-    items = get_all_products(category_id=category_id)
-    return render_template("products.html", title="Products", categories=cats, products=items, selected_category=category_id)
+    facets = product_facet_counts(category_id, price_band, in_stock)
+    items, next_cursor, prev_cursor = [], None, None
+    if facets["total"]:
+        items, next_cursor, prev_cursor = paginate(
+            lambda n, **cursor: get_all_products(category_id=category_id, limit=n,
+                                                 price_band=price_band, in_stock=in_stock,
+                                                 **cursor),
+            page_limit(),
+        )
+    return render_template("products.html", title="Products", categories=cats, products=items,
+                           selected_category=category_id, selected_price=price_band,
+                           in_stock=in_stock, facets=facets, price_bands=PRICE_BANDS,
+                           next_cursor=next_cursor, prev_cursor=prev_cursor)
 
 @app.route("/product/<int:id>/")
+@cached_page
 def product(id):
     item = get_product_by_id(id)
     if item is None:
         flash(category="warning", message="Product not found!")
         return redirect(url_for("products"))
-    return render_template("product.html", title=item["name"], product=item)
+    return render_template("product.html", title=item["name"], product=item,
+                           related=related_products(id))
 
 
 # Product CRUD (Admin/User-owned)
@@ -207,6 +440,8 @@ def product_create():
             image_url,
             stock
         )
+        if file and file.filename:
+            process_upload(image_url)  # thumbnails/WebP in the background
 
         flash(category="success", message="Product created successfully!")
         return redirect(url_for("products"))
@@ -271,6 +506,8 @@ def product_update(id):
             return redirect(url_for("product_update", id=id))
 
         update_product(id, category_id, name, description, price, image_url, stock)
+        if file and file.filename:
+            process_upload(image_url)  # thumbnails/WebP in the background
         flash(category="success", message="Product updated successfully!")
         return redirect(url_for("product", id=id))
 
@@ -296,12 +533,52 @@ def product_delete(id):
         flash(category="danger", message="You do not have permission to delete this product.")
         return redirect(url_for("product", id=id))
 
-    delete_product(id)
+    try:
+        delete_product(id)
+    except sqlite3.IntegrityError:
+        flash(category="danger", message="This product has been ordered and cannot be deleted.")
+        return redirect(url_for("product", id=id))
     flash(category="success", message="Product deleted successfully!")
     return redirect(url_for("products"))
 
 
 
+# Bulk import/export (catalog_io.py). The upload is parsed as it is read
+# and written in chunked transactions, so file size is not limited by memory.
+@app.route("/admin/products/import/", methods=("GET", "POST"))
+@admin_required
+def products_import():
+    report = None
+    if request.method == "POST":
+        file = request.files.get("file")
+        if not file or not file.filename:
+            flash(category="danger", message="Choose a CSV or JSON Lines file.")
+            return redirect(url_for("products_import"))
+        fmt = request.form.get("format") or detect_format(file.filename)
+        if fmt not in FORMATS:
+            fmt = "csv"
+        stream = io.TextIOWrapper(file.stream, encoding="utf-8-sig", newline="")
+        report = import_products(stream, fmt, session["user_id"],
+                                 create_categories=bool(request.form.get("create_categories")))
+        flash(category="success" if not report.failed else "warning",
+              message=f"Imported {report.written} of {report.rows} rows "
+                      f"in {report.elapsed:.1f}s ({report.rate:.0f} rows/s).")
+    return render_template("product_import.html", title="Import / Export Products",
+                           report=report, formats=FORMATS)
+
+
+@app.route("/admin/products/export/")
+@admin_required
+def products_export():
+    fmt = request.args.get("format", "csv")
+    if fmt not in FORMATS:
+        abort(400)
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    response = app.response_class(stream_with_context(export_products_text(fmt)), mimetype=mimetype)
+    response.headers["Content-Disposition"] = f"attachment; filename=products.{fmt}"
+    return response
+
+
 @app.route("/cart/")
 def cart_view():
     if session.get("user_id") is None:
@@ -337,13 +614,90 @@ def cart_update(product_id):
     return redirect(url_for("cart_view"))
 
 
+# Many cart changes in one request and one transaction. Form posts send
+# qty-<product_id>=<n> per line (0 removes) and get the cart page back;
+# JSON posts send {"operations": [{"op": "add"|"set"|"remove",
+# "product_id": 1, "qty": 2}, ...]} and get the cart back as JSON.
+MAX_CART_OPERATIONS = 100
+
+def cart_operations_from_request():
+    if request.is_json:
+        payload = request.get_json(silent=True)
+        ops = payload.get("operations") if isinstance(payload, dict) else None
+        if not isinstance(ops, list):
+            return None
+        operations = []
+        for op in ops:
+            if not isinstance(op, dict) or op.get("op") not in CART_OPS:
+                return None
+            product_id, qty = op.get("product_id"), op.get("qty", 1)
+            if type(product_id) is not int or type(qty) is not int or qty < 0:
+                return None
+            operations.append((op["op"], product_id, qty))
+        return operations
+
+    operations = []
+    for key, value in request.form.items():
+        if not key.startswith("qty-"):
+            continue
+        try:
+            product_id, qty = int(key[4:]), int(value or 0)
+        except ValueError:
+            return None
+        operations.append(("set", product_id, max(qty, 0)))
+    return operations
+
+def cart_json(items):
+    lines = [
+        {"product_id": row["product_id"], "name": row["name"], "price": row["price"],
+         "quantity": row["quantity"], "line_total": round(row["price"] * row["quantity"], 2)}
+        for row in items
+    ]
+    return {"items": lines, "total": round(sum(line["line_total"] for line in lines), 2)}
+
+
+@app.route("/cart/batch/", methods=("POST",))
+def cart_batch():
+    if session.get("user_id") is None:
+        if request.is_json:
+            return jsonify(error="login required"), 401
+        flash("Please login first.", "warning")
+        return redirect(url_for("login"))
+
+    operations = cart_operations_from_request()
+    if operations is None or len(operations) > MAX_CART_OPERATIONS:
+        if request.is_json:
+            return jsonify(error="invalid operations"), 400
+        flash("Could not update the cart.", "danger")
+        return redirect(url_for("cart_view"))
+
+    try:
+        items = cart_apply(session["user_id"], operations)
+    except sqlite3.IntegrityError:
+        if request.is_json:
+            return jsonify(error="unknown product"), 400
+        flash("Some products are no longer available.", "danger")
+        return redirect(url_for("cart_view"))
+
+    if request.is_json:
+        return jsonify(cart_json(items))
+    flash("Cart updated.", "info")
+    total = sum(row["price"] * row["quantity"] for row in items)
+    return render_template("cart.html", title="Your Cart", cart_items=items, total=total)
+
+
 @app.route("/checkout/", methods=("POST",))
 def checkout():
     if session.get("user_id") is None:
         flash("Please login to checkout.", "warning")
         return redirect(url_for("login"))
 
-    order_id = order_create_from_cart(session["user_id"])
+    try:
+        order_id = order_create_from_cart(session["user_id"])
+    except OutOfStockError as e:
+        names = ", ".join(row["name"] for row in e.items)
+        flash(f"Not enough stock for: {names}. Please update your cart.", "danger")
+        return redirect(url_for("cart_view"))
     if order_id is None:
         flash("Your cart is empty.", "warning")
         return redirect(url_for("products"))
@@ -358,8 +712,12 @@ def orders():
         flash("Please login to view orders.", "warning")
         return redirect(url_for("login"))
 
-    my_orders = orders_for_user(session["user_id"])
-    return render_template("orders.html", title="My Orders", orders=my_orders)
+    my_orders, next_cursor, prev_cursor = paginate(
+        lambda n, **cursor: orders_for_user(session["user_id"], limit=n, **cursor),
+        page_limit(),
+    )
+    return render_template("orders.html", title="My Orders", orders=my_orders,
+                           next_cursor=next_cursor, prev_cursor=prev_cursor)
 
 
 @app.route("/orders/<int:order_id>/")
@@ -368,13 +726,208 @@ def order_receipt(order_id):
         flash("Please login first.", "warning")
         return redirect(url_for("login"))
 
-    order = order_get(order_id)
+    order, items = order_get_with_items(order_id)
     if order is None or order["user_id"] != session["user_id"]:
         flash("Order not found.", "danger")
         return redirect(url_for("orders"))
 
-    items = order_get_items(order_id)
     return render_template("order_receipt.html", title=f"Order #{order_id}", order=order, items=items)
 
+
+# CSV exports, one row per order line, streamed as the rows are read
+ORDER_CSV_FIELDS = ("order_id", "created", "status", "order_total", "product_id",
+                    "product_name", "quantity", "price_each", "line_total")
+
+def order_lines_csv(rows, with_user=False):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow((("user_id", "username") if with_user else ()) + ORDER_CSV_FIELDS)
+    for count, row in enumerate(rows, start=1):
+        line_total = row["quantity"] * row["price_each"] if row["quantity"] is not None else None
+        writer.writerow(
+            ((row["user_id"], row["username"]) if with_user else ())
+            + (row["order_id"], row["created"], row["status"], f"{row['total']:.2f}",
+               row["product_id"], row["product_name"], row["quantity"],
+               None if row["price_each"] is None else f"{row['price_each']:.2f}",
+               None if line_total is None else f"{line_total:.2f}")
+        )
+        if count % 500 == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def csv_download(rows, filename, with_user=False):
+    response = app.response_class(stream_with_context(order_lines_csv(rows, with_user)),
+                                  mimetype="text/csv")
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    return response
+
+
+@app.route("/orders/export.csv")
+def orders_export():
+    if session.get("user_id") is None:
+        flash("Please login to view orders.", "warning")
+        return redirect(url_for("login"))
+
+    return csv_download(export_order_lines(user_id=session["user_id"]), "my-orders.csv")
+
+
+@app.route("/admin/orders/export.csv")
+@admin_required
+def admin_orders_export():
+    # ?start=YYYY-MM-DD&end=YYYY-MM-DD, both inclusive; default last 30 days
+    try:
+        end = date.fromisoformat(request.args.get("end") or date.today().isoformat())
+        start = date.fromisoformat(request.args.get("start") or (end - timedelta(days=30)).isoformat())
+    except ValueError:
+        abort(400)
+    rows = export_order_lines(start=start.isoformat(), end=(end + timedelta(days=1)).isoformat())
+    return csv_download(rows, f"orders-{start}-{end}.csv", with_user=True)
+
+
+@app.route("/admin/sales/")
+@admin_required
+def sales_dashboard():
+    # ?start=YYYY-MM-DD&end=YYYY-MM-DD, both inclusive; default last 30 days.
+    # Served from the daily rollups, so cost depends on the range, not on
+    # how many orders there are.
+    try:
+        end = date.fromisoformat(request.args.get("end") or date.today().isoformat())
+        start = date.fromisoformat(request.args.get("start") or (end - timedelta(days=29)).isoformat())
+    except ValueError:
+        abort(400)
+    days = sales_by_day(start.isoformat(), end.isoformat())
+    totals = {
+        "orders": sum(d["orders"] for d in days),
+        "units": sum(d["units"] for d in days),
+        "revenue": sum(d["revenue"] for d in days),
+    }
+    return render_template(
+        "sales.html", title="Sales", start=start, end=end, days=days, totals=totals,
+        categories=sales_by_category(start.isoformat(), end.isoformat()),
+        products=top_products(start.isoformat(), end.isoformat()),
+    )
+
+
+# ---------- Read-only JSON API ----------
+# Same helpers and keyset cursors as the HTML pages, no templates or CSRF
+# tokens. ?fields=name,price selects only those columns (PRODUCT_FIELDS).
+# Responses carry a strong ETag of the body and Last-Modified from the
+# catalog and stock change counters, so clients revalidate with a 304, and are
+# gzipped when the client accepts it.
+API_GZIP_MIN_BYTES = 1024
+
+def api_fields():
+    raw = request.args.get("fields")
+    if not raw:
+        return None
+    fields = [f.strip() for f in raw.split(",") if f.strip()]
+    if not fields or any(f not in PRODUCT_FIELDS for f in fields):
+        abort(make_response(jsonify(error="unknown field",
+                                    fields=sorted(PRODUCT_FIELDS)), 400))
+    return fields
+
+def api_product(row, fields):
+    if fields:
+        return {f: row[f] for f in fields}
+    item = {f: row[f] for f in PRODUCT_FIELDS if f in row.keys()}
+    item["category_id"], item["category"] = row["category"], row["category_name"]
+    return item
+
+def api_response(payload):
+    body = json.dumps(payload, separators=(",", ":")).encode()
+    response = app.response_class(body, mimetype="application/json")
+    response.cache_control.no_cache = True  # always revalidate, 304 is cheap
+    changed = get_catalog_last_changed()
+    if changed:
+        last_modified = datetime.strptime(changed, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+        # Dates have one-second resolution: another change later in this
+        # second would keep the same date, so a date from the current second
+        # is left out and clients revalidate on the ETag alone
+        if last_modified < datetime.now(timezone.utc).replace(microsecond=0):
+            response.last_modified = last_modified
+    etag = hashlib.sha256(body).hexdigest()[:32]
+    response.vary.add("Accept-Encoding")
+    if len(body) >= API_GZIP_MIN_BYTES and "gzip" in request.accept_encodings:
+        response.set_data(gzip.compress(body, compresslevel=6))
+        response.content_encoding = "gzip"
+        etag += "-gz"  # a different representation needs its own ETag
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+def api_page(fetch, fields):
+    rows, next_cursor, prev_cursor = paginate(fetch, page_limit())
+    return api_response({
+        "items": [api_product(row, fields) for row in rows],
+        "next": next_cursor,
+        "prev": prev_cursor,
+    })
+
+
+@app.route("/api/products")
+def api_products():
+    fields = api_fields()
+    category_id = request.args.get("category", default=None, type=int)
+    return api_page(
+        lambda n, **cursor: get_all_products(category_id=category_id, limit=n,
+                                             fields=fields, **cursor),
+        fields,
+    )
+
+
+@app.route("/api/products/<int:id>")
+def api_product_detail(id):
+    fields = api_fields()
+    row = get_product_by_id(id)
+    if row is None:
+        return jsonify(error="not found"), 404
+    item = api_product(row, None)  # cached full row, projected here
+    return api_response({f: item[f] for f in fields} if fields else item)
+
+
+@app.route("/api/categories")
+def api_categories():
+    return api_response({"items": [{"id": c["id"], "name": c["name"]}
+                                   for c in get_all_categories()]})
+
+
+@app.route("/api/search")
+def api_search():
+    fields = api_fields()
+    q = request.args.get("q", "").strip()
+    if not q:
+        return jsonify(error="q is required"), 400
+    return api_page(
+        lambda n, **cursor: search_products(q, limit=n, fields=fields, **cursor),
+        fields,
+    )
+
+
+@app.route("/metrics")
+@admin_required
+def metrics_view():
+    if not metrics.ENABLED:
+        abort(404)
+    body = metrics.render(caches={"catalog": catalog_cache, "page": page_cache})
+    return app.response_class(body, mimetype="text/plain; version=0.0.4")
+
+# Pages requested once at startup by warm_up()
+WARMUP_PATHS = ("/", "/products/", "/search/suggest?q=a")  # the last builds the suggest index
+
+def warm_up(paths=WARMUP_PATHS):
+    # Compile (or load from the bytecode cache) every template and request
+    # a few pages, so the first visitors of a new worker don't pay for
+    # compilation and cold caches. The requests show up in /metrics.
+    for name in app.jinja_env.list_templates(extensions=("html",)):
+        app.jinja_env.get_template(name)
+    with app.test_client() as client:
+        for path in paths:
+            client.get(path)
+
+# STUDENTMART_WARMUP=1 warms up each worker when the app is imported
+if os.environ.get("STUDENTMART_WARMUP") == "1":
+    warm_up()
+
 if __name__ == "__main__":
     app.run(debug=True)
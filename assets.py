@@ -0,0 +1,70 @@
+import hashlib
+import os
+import stat
+import threading
+
+# Content-hashed URLs for files under static/ (styles.css, uploads, image
+# variants). A fingerprinted URL never changes content, so it is served with
+# a one-year immutable Cache-Control and browsers stop revalidating it.
+#
+#   /static/styles.css  ->  /assets/3f2a9c1b7d4e/styles.css
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_FOLDER = os.path.join(BASE_DIR, "static")
+STATIC_URL = "/static/"
+ASSET_URL = "/assets/"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# filename -> (mtime_ns, size, fingerprint); a stat per lookup keeps the
+# manifest correct when an upload is replaced while the app is running
+_manifest = {}
+_lock = threading.Lock()
+
+
+def _static_path(filename):
+    path = os.path.realpath(os.path.join(STATIC_FOLDER, filename))
+    if not path.startswith(os.path.realpath(STATIC_FOLDER) + os.sep):
+        return None
+    return path
+
+
+def fingerprint(filename):
+    # Short content hash of static/<filename>, or None if it is not a file
+    path = _static_path(filename)
+    if path is None:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+
+    entry = _manifest.get(filename)
+    if entry and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+        return entry[2]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            digest.update(chunk)
+    value = digest.hexdigest()[:12]
+    with _lock:
+        _manifest[filename] = (st.st_mtime_ns, st.st_size, value)
+    return value
+
+
+def asset_url(filename):
+    # Fingerprinted URL for static/<filename>; plain /static/ URL if missing
+    value = fingerprint(filename)
+    if value is None:
+        return STATIC_URL + filename
+    return f"{ASSET_URL}{value}/{filename}"
+
+
+def static_url(url):
+    # Same for a stored URL such as products.image_url; external URLs and
+    # anything outside /static/ come back unchanged
+    if url and url.startswith(STATIC_URL):
+        return asset_url(url[len(STATIC_URL):])
+    return url
@@ -0,0 +1,96 @@
+import argparse
+import csv
+import os
+import random
+import sqlite3
+import time
+
+from bench.common import create_schema, use_scratch_database
+from bench.datagen import ADJECTIVES, CATEGORY_NAMES, NOUNS, brands
+
+# Bulk catalog import/export (catalog_io.py) on a generated supplier file.
+#
+#   python -m bench.bulk [--rows N]        default 100000
+#
+# Imports the CSV into an empty catalog (inserts), exports it, re-imports
+# the unchanged export (matched by id, nothing rewritten), imports a changed
+# file (updates by sku), and times one-at-a-time create_product calls (the
+# admin form's path, minus HTTP) on a sample for comparison.
+
+SINGLE_SAMPLE = 2_000
+
+
+def write_supplier_file(path, rows, seed=1):
+    rnd = random.Random(seed)
+    brand_names = brands(seed=seed)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(("sku", "name", "description", "price", "stock", "category"))
+        for i in range(rows):
+            brand, adjective, noun = rnd.choice(brand_names), rnd.choice(ADJECTIVES), rnd.choice(NOUNS)
+            writer.writerow((
+                f"SUP-{i:07d}",
+                f"{brand} {adjective} {noun}".title(),
+                f"{adjective.capitalize()} {noun} by {brand.capitalize()}.",
+                f"{rnd.uniform(0.5, 80):.2f}",
+                rnd.choice((0, 5, 20, 100)),
+                rnd.choice(CATEGORY_NAMES),
+            ))
+
+
+def timed_import(catalog_io, path, label):
+    with open(path, encoding="utf-8", newline="") as f:
+        report = catalog_io.import_products(f, "csv", user_id=1, create_categories=True)
+    print(f"{label:<28}{report.rows:>9}{report.elapsed:>9.2f}{report.rate:>11.0f}"
+          f"{report.failed:>8}")
+    return report
+
+
+def main(rows=100_000):
+    db_path = use_scratch_database("bulk.db")
+    create_schema(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO users (username, password, is_admin) VALUES ('admin', '-', 1)")
+    conn.commit()
+    conn.close()
+
+    import catalog_io
+    from db import db
+
+    supplier = os.path.join(os.path.dirname(db_path), "supplier.csv")
+    exported = os.path.join(os.path.dirname(db_path), "export.csv")
+    write_supplier_file(supplier, rows)
+    size_mb = os.path.getsize(supplier) / 1e6
+    print(f"{rows} rows, {size_mb:.1f} MB CSV, chunks of {catalog_io.CHUNK_SIZE}")
+    print(f"{'':<28}{'rows':>9}{'seconds':>9}{'rows/s':>11}{'failed':>8}")
+
+    timed_import(catalog_io, supplier, "import (insert)")
+
+    started, stats = time.perf_counter(), {}
+    with open(exported, "w", encoding="utf-8", newline="") as f:
+        for text in catalog_io.export_products_text("csv", stats):
+            f.write(text)
+    elapsed = time.perf_counter() - started
+    print(f"{'export (stream)':<28}{stats['rows']:>9}{elapsed:>9.2f}{stats['rows'] / elapsed:>11.0f}"
+          f"{0:>8}")
+
+    timed_import(catalog_io, exported, "re-import export (no-op)")
+
+    write_supplier_file(supplier, rows, seed=2)  # same skus, new names/prices
+    timed_import(catalog_io, supplier, "changed file (update by sku)")
+
+    category_id = db.get_all_categories()[0]["id"]
+    started = time.perf_counter()
+    for i in range(SINGLE_SAMPLE):
+        db.create_product(1, category_id, f"Single {i}", "", 1.0, "", 1)
+    elapsed = time.perf_counter() - started
+    print(f"{'create_product one by one':<28}{SINGLE_SAMPLE:>9}{elapsed:>9.2f}"
+          f"{SINGLE_SAMPLE / elapsed:>11.0f}{0:>8}")
+    db.close_db_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time bulk catalog import/export.")
+    parser.add_argument("--rows", type=int, default=100_000, help="supplier file rows")
+    args = parser.parse_args()
+    main(args.rows)
@@ -0,0 +1,151 @@
+import argparse
+import random
+import shutil
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.common import create_schema, percentile, use_scratch_database
+
+# Parallel checkouts: transactional order_create_from_cart vs the old code.
+#
+#   python -m bench.checkout [--users N] [--threads N]
+#
+# Every user has a cart and all of them check out at once. The same data
+# is run through order_create_from_cart and through a copy of the previous
+# implementation (three connections, one INSERT per line, no stock
+# handling). With ample stock this compares throughput; with scarce stock
+# the new path must never sell more than was in stock.
+
+PRODUCTS = 200
+SCENARIOS = (("ample stock", 1_000_000), ("scarce stock", 5))
+
+
+def build(db_path, users, stock, seed=7):
+    create_schema(db_path)
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO categories (name) VALUES ('Bench')")
+    conn.executemany("INSERT INTO users (username, password) VALUES (?, 'x')",
+                     [(f"user{i}",) for i in range(users)])
+    conn.executemany(
+        "INSERT INTO products (user, category, name, price, stock) VALUES (1, 1, ?, ?, ?)",
+        [(f"Product {i}", round(rnd.uniform(1, 20), 2), stock) for i in range(PRODUCTS)],
+    )
+    carts = []
+    for user_id in range(1, users + 1):
+        for product_id in rnd.sample(range(1, PRODUCTS + 1), 3):
+            carts.append((user_id, product_id, rnd.randint(1, 2)))
+    conn.executemany("INSERT INTO cart_items (user_id, product_id, quantity) VALUES (?, ?, ?)", carts)
+    conn.commit()
+    conn.close()
+
+
+def legacy_checkout(db, user_id):
+    # The pre-transaction implementation, kept here as the baseline
+    conn = db._open_connection()
+    items = conn.execute("""
+        SELECT cart_items.product_id, cart_items.quantity, products.price
+        FROM cart_items JOIN products ON cart_items.product_id = products.id
+        WHERE cart_items.user_id = ?
+    """, (user_id,)).fetchall()
+    conn.close()
+    if not items:
+        return None
+    total = sum(row["price"] * row["quantity"] for row in items)
+
+    conn = db._open_connection()
+    cur = conn.cursor()
+    cur.execute("INSERT INTO orders (user_id, total, status) VALUES (?, ?, ?)",
+                (user_id, total, "placed"))
+    order_id = cur.lastrowid
+    for row in items:
+        cur.execute("""
+            INSERT INTO order_items (order_id, product_id, quantity, price_each)
+            VALUES (?, ?, ?, ?)
+        """, (order_id, row["product_id"], row["quantity"], row["price"]))
+    conn.commit()
+    conn.close()
+
+    conn = db._open_connection()
+    conn.execute("DELETE FROM cart_items WHERE user_id=?", (user_id,))
+    conn.commit()
+    conn.close()
+    return order_id
+
+
+def run(checkout, users, threads):
+    from db.db import OutOfStockError
+
+    latencies, outcomes = [], {"ok": 0, "out_of_stock": 0, "error": 0}
+
+    def one(user_id):
+        started = time.perf_counter()
+        try:
+            checkout(user_id)
+            outcome = "ok"
+        except OutOfStockError:
+            outcome = "out_of_stock"
+        except sqlite3.Error:
+            outcome = "error"
+        return outcome, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for outcome, seconds in pool.map(one, range(1, users + 1)):
+            outcomes[outcome] += 1
+            latencies.append(seconds * 1000)
+    elapsed = time.perf_counter() - started
+    return elapsed, latencies, outcomes
+
+
+def oversold(db_path, stock):
+    conn = sqlite3.connect(db_path)
+    sold = dict(conn.execute("SELECT product_id, SUM(quantity) FROM order_items GROUP BY product_id"))
+    negative = conn.execute("SELECT COUNT(*) FROM products WHERE stock < 0").fetchone()[0]
+    conn.close()
+    over = sum(max(0, qty - stock) for qty in sold.values())
+    return over, negative
+
+
+def main(users=400, threads=16):
+    scratch = use_scratch_database("checkout.db")
+    from db import db
+
+    print(f"{users} checkouts, {threads} threads, {PRODUCTS} products")
+    print(f"{'':<26}{'chk/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'ok':>6}{'no stock':>10}{'errors':>8}{'oversold':>10}")
+    failed = False
+    for scenario, stock in SCENARIOS:
+        new_path = scratch.replace("checkout.db", f"new-{stock}.db")
+        legacy_path = scratch.replace("checkout.db", f"legacy-{stock}.db")
+        build(new_path, users, stock)
+        shutil.copy(new_path, legacy_path)
+
+        for label, path, checkout in (
+            ("transaction", new_path, db.order_create_from_cart),
+            ("legacy", legacy_path, lambda uid: legacy_checkout(db, uid)),
+        ):
+            db.DB_PATH = path
+            elapsed, latencies, outcomes = run(checkout, users, threads)
+            over, negative = oversold(path, stock)
+            print(f"{scenario + ', ' + label:<26}{users / elapsed:>8.0f}"
+                  f"{percentile(latencies, 50):>9.1f}{percentile(latencies, 95):>9.1f}"
+                  f"{percentile(latencies, 99):>9.1f}{outcomes['ok']:>6}"
+                  f"{outcomes['out_of_stock']:>10}{outcomes['error']:>8}{over:>10}")
+            if label == "transaction" and (over or negative):
+                failed = True
+
+    if failed:
+        print("FAIL: transactional checkout oversold")
+        sys.exit(1)
+    print("OK: transactional checkout never oversold")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel checkouts: transactional vs the old code.")
+    parser.add_argument("--users", type=int, default=400, help="carts checking out at once")
+    parser.add_argument("--threads", type=int, default=16)
+    args = parser.parse_args()
+    main(args.users, args.threads)
@@ -0,0 +1,35 @@
+import os
+import sqlite3
+import tempfile
+
+# Shared setup for the benchmark scripts. Everything runs against a fresh
+# database in a temp directory; db/database.db is never touched.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def use_scratch_database(name="bench.db"):
+    # Must run before db.db is imported: it reads STUDENTMART_DB at import
+    tmp = tempfile.mkdtemp(prefix="studentmart-bench-")
+    path = os.path.join(tmp, name)
+    os.environ["STUDENTMART_DB"] = path
+    return path
+
+
+def create_schema(db_path):
+    # schema.sql + every migration, i.e. what a new install gets
+    from db.migrate import migrate
+
+    conn = sqlite3.connect(db_path)
+    with open(os.path.join(ROOT, "db", "schema.sql"), "r", encoding="utf-8") as f:
+        conn.executescript(f.read())
+    conn.close()
+    migrate(db_path)
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
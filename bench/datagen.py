@@ -0,0 +1,191 @@
+import argparse
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from bench.common import create_schema
+from db.migrate import rebuild_product_pairs, rebuild_sales_rollups
+
+# Synthetic StudentMart data at scale, written straight into the schema.
+#
+#   python -m bench.datagen out.db [--products N] [--users N] [--orders N] ...
+#
+# Deterministic for a given --seed. Product names mix generated brands with
+# a grocery/kitchen vocabulary so search has realistic hit rates; product
+# popularity in orders is skewed (a few products sell a lot), and order and
+# product timestamps are spread over the last two years. Every user has the
+# password "password"; user 1 ("admin") is an admin and owns the catalog.
+
+NOUNS = [
+    "rice", "dal", "lentils", "flour", "sugar", "salt", "pepper", "chilli",
+    "turmeric", "masala", "tea", "coffee", "milk", "bread", "butter", "ghee",
+    "noodles", "pasta", "sauce", "paste", "oil", "yoghurt", "pan", "pot",
+    "kettle", "knife", "spoon", "fork", "plate", "bowl", "cup", "blender",
+    "cooker", "fryer", "board", "towel", "tissues", "container", "jar", "tray",
+]
+ADJECTIVES = [
+    "organic", "basmati", "wholegrain", "spicy", "mild", "roasted", "instant",
+    "premium", "value", "non-stick", "stainless", "ceramic", "glass", "large",
+    "small", "family", "mini", "electric", "classic", "fresh",
+]
+CATEGORY_NAMES = [
+    "Groceries", "Kitchen Items", "Spices", "Snacks", "Beverages", "Dairy",
+    "Bakery", "Frozen", "Cleaning", "Stationery", "Toiletries", "Cookware",
+]
+SYLLABLES = ["ka", "ro", "mi", "ta", "shi", "lu", "ven", "dor", "pa", "zen", "qi", "bel"]
+
+PASSWORD = "password"
+SPAN_DAYS = 730
+CHUNK = 50_000
+
+
+def brands(seed=42, count=300):
+    rnd = random.Random(seed)
+    names = set()
+    while len(names) < count:
+        names.add("".join(rnd.choices(SYLLABLES, k=3)))
+    return sorted(names)
+
+
+def _timestamps(rnd, count, now):
+    # Sorted ascending so ids and created grow together, like real inserts
+    start = now - timedelta(days=SPAN_DAYS)
+    offsets = sorted(rnd.random() * SPAN_DAYS * 86400 for _ in range(count))
+    return [(start + timedelta(seconds=s)).strftime("%Y-%m-%d %H:%M:%S") for s in offsets]
+
+
+def _chunks(rows, size=CHUNK):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def generate(db_path, products=100_000, categories=40, users=50_000, orders=330_000,
+             carts=5_000, seed=1, verbose=True):
+    from werkzeug.security import generate_password_hash
+
+    def log(message):
+        if verbose:
+            print(f"[{time.perf_counter() - started:6.1f}s] {message}")
+
+    started = time.perf_counter()
+    rnd = random.Random(seed)
+    now = datetime.now().replace(microsecond=0)
+    create_schema(db_path)
+
+    conn = sqlite3.connect(db_path)
+    # Scratch file: durability does not matter while loading
+    conn.execute("PRAGMA journal_mode = MEMORY")
+    conn.execute("PRAGMA synchronous = OFF")
+
+    password_hash = generate_password_hash(PASSWORD)
+    conn.execute("INSERT INTO users (username, password, is_admin) VALUES ('admin', ?, 1)",
+                 (password_hash,))
+    conn.executemany("INSERT INTO users (username, password) VALUES (?, ?)",
+                     ((f"user{i}", password_hash) for i in range(1, users)))
+    log(f"{users} users")
+
+    names = [CATEGORY_NAMES[i] if i < len(CATEGORY_NAMES) else f"Category {i + 1}"
+             for i in range(categories)]
+    conn.executemany("INSERT INTO categories (name) VALUES (?)", ((n,) for n in names))
+
+    brand_names = brands(seed=seed)
+    created = _timestamps(rnd, products, now)
+    catalog = []
+    for i in range(products):
+        brand, adjective, noun = rnd.choice(brand_names), rnd.choice(ADJECTIVES), rnd.choice(NOUNS)
+        catalog.append((
+            created[i],
+            rnd.randint(1, categories),
+            f"{brand} {adjective} {noun}".title(),
+            f"{adjective.capitalize()} {noun} by {brand.capitalize()}. "
+            f"Pairs well with {rnd.choice(NOUNS)}.",
+            round(rnd.uniform(0.5, 80), 2),
+            rnd.choice((0, 0, 5, 20, 50, 100, 250, 1000)),
+        ))
+    for chunk in _chunks(catalog):
+        conn.executemany("""
+            INSERT INTO products (created, user, category, name, description, price, stock)
+            VALUES (?, 1, ?, ?, ?, ?, ?)
+        """, chunk)
+    conn.commit()
+    prices = [row[4] for row in catalog]
+    product_categories = [row[1] for row in catalog]
+    del catalog
+    log(f"{products} products in {categories} categories")
+
+    # Popularity ~ 1/rank over a shuffled catalog
+    ranked = list(range(1, products + 1))
+    rnd.shuffle(ranked)
+    cum_weights, total = [], 0.0
+    for rank in range(1, products + 1):
+        total += 1.0 / rank
+        cum_weights.append(total)
+
+    order_rows, item_rows = [], []
+    item_count = 0
+    for order_id, when in enumerate(_timestamps(rnd, orders, now), start=1):
+        lines = set(rnd.choices(ranked, cum_weights=cum_weights, k=rnd.randint(1, 5)))
+        order_total = 0.0
+        for product_id in lines:
+            qty = rnd.randint(1, 3)
+            price = prices[product_id - 1]
+            order_total += price * qty
+            item_rows.append((order_id, product_id, qty, price, product_categories[product_id - 1]))
+        order_rows.append((order_id, rnd.randint(1, users), when, round(order_total, 2)))
+        if len(item_rows) >= CHUNK:
+            item_count += _flush_orders(conn, order_rows, item_rows)
+    item_count += _flush_orders(conn, order_rows, item_rows)
+    log(f"{orders} orders, {item_count} order lines")
+
+    cart_rows = []
+    for user_id in rnd.sample(range(2, users + 1), min(carts, users - 1)):
+        for product_id in set(rnd.choices(ranked, cum_weights=cum_weights, k=rnd.randint(1, 4))):
+            cart_rows.append((user_id, product_id, rnd.randint(1, 3)))
+    conn.executemany("INSERT INTO cart_items (user_id, product_id, quantity) VALUES (?, ?, ?)",
+                     cart_rows)
+    conn.commit()
+    log(f"{len(cart_rows)} cart lines for {carts} users")
+
+    # Checkout maintains the rollups and pairs; rows written directly need a rebuild
+    rebuild_sales_rollups(conn)
+    conn.commit()
+    log("sales rollups")
+    rebuild_product_pairs(conn)
+    conn.commit()
+    log("product pairs")
+
+    conn.close()
+    log(f"done: {db_path}")
+    return brand_names
+
+
+def _flush_orders(conn, order_rows, item_rows):
+    conn.executemany(
+        "INSERT INTO orders (id, user_id, created, status, total) VALUES (?, ?, ?, 'placed', ?)",
+        order_rows,
+    )
+    conn.executemany(
+        "INSERT INTO order_items (order_id, product_id, quantity, price_each, category_id)"
+        " VALUES (?, ?, ?, ?, ?)",
+        item_rows,
+    )
+    conn.commit()
+    count = len(item_rows)
+    order_rows.clear()
+    item_rows.clear()
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a large StudentMart database.")
+    parser.add_argument("db_path")
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--categories", type=int, default=40)
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--orders", type=int, default=330_000, help="~3 lines per order")
+    parser.add_argument("--carts", type=int, default=5_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    generate(args.db_path, args.products, args.categories, args.users, args.orders,
+             args.carts, args.seed)
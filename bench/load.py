@@ -0,0 +1,170 @@
+import argparse
+import os
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+
+from bench.common import percentile, use_scratch_database
+
+# End-to-end load test through the Flask test client.
+#
+#   python -m bench.load                      generate a mid-size dataset first
+#   python -m bench.load --db big.db          run against an existing database
+#   python -m bench.load --threads 16 --duration 30
+#
+# Each thread acts as one anonymous visitor plus one logged-in shopper and
+# picks a weighted action per iteration. Reports requests, throughput and
+# p50/p95/p99 latency per endpoint. Sessions are seeded directly (no
+# password hashing; see bench.login for that) and CSRF checks are off.
+# Point --db at a copy: the run adds carts and orders.
+
+ACTIONS = {
+    # name: weight
+    "home": 15,
+    "search": 10,
+    "products": 15,
+    "products next page": 5,
+    "product": 25,
+    "cart add": 10,
+    "cart update": 5,
+    "cart view": 5,
+    "checkout": 3,
+    "orders": 7,
+}
+QUERIES = ["rice", "cof", "basmati rice", "pan", "masala tea", "kettle", "quinoa"]
+
+
+def _next_link(body):
+    m = re.search(r'href="([^"]+)">Next', body)
+    return m.group(1).replace("&amp;", "&") if m else None
+
+
+class Visitor:
+    def __init__(self, app, user_id, product_count, category_count, seed):
+        self.rnd = random.Random(seed)
+        self.anon = app.test_client()
+        self.shopper = app.test_client()
+        with self.shopper.session_transaction() as session:
+            session["user_id"] = user_id
+            session["username"] = f"user{user_id}"
+        self.products = product_count
+        self.categories = category_count
+
+    def product_id(self):
+        return self.rnd.randint(1, self.products)
+
+    def act(self, action):
+        rnd = self.rnd
+        if action == "home":
+            return self.anon.get("/")
+        if action == "search":
+            return self.anon.get("/", query_string={"q": rnd.choice(QUERIES)})
+        if action == "products":
+            return self.anon.get("/products/", query_string={"category": rnd.randint(1, self.categories)})
+        if action == "products next page":
+            first = self.anon.get("/products/", query_string={"category": rnd.randint(1, self.categories)})
+            link = _next_link(first.get_data(as_text=True))
+            return self.anon.get(link) if link else first
+        if action == "product":
+            return self.anon.get(f"/product/{self.product_id()}/")
+        if action == "cart add":
+            return self.shopper.post(f"/cart/add/{self.product_id()}/", data={"qty": rnd.randint(1, 2)})
+        if action == "cart update":
+            return self.shopper.post(f"/cart/update/{self.product_id()}/", data={"qty": rnd.randint(0, 3)})
+        if action == "cart view":
+            return self.shopper.get("/cart/")
+        if action == "checkout":
+            return self.shopper.post("/checkout/")
+        if action == "orders":
+            return self.shopper.get("/orders/")
+        raise ValueError(action)
+
+
+def run(app, threads, duration, product_count, category_count, user_count, seed=1):
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    names, weights = zip(*ACTIONS.items())
+
+    def worker(n):
+        visitor = Visitor(app, user_id=2 + (n % max(1, user_count - 1)),
+                          product_count=product_count, category_count=category_count,
+                          seed=seed * 1000 + n)
+        local, failed = defaultdict(list), defaultdict(int)
+        while time.perf_counter() < deadline:
+            action = visitor.rnd.choices(names, weights)[0]
+            started = time.perf_counter()
+            response = visitor.act(action)
+            local[action].append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400 and response.status_code != 404:
+                failed[action] += 1
+        with lock:
+            for action, samples in local.items():
+                latencies[action].extend(samples)
+            for action, count in failed.items():
+                errors[action] += count
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return time.perf_counter() - started, latencies, errors
+
+
+def report(elapsed, latencies, errors):
+    print(f"{'endpoint':<20}{'requests':>9}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'p99 ms':>9}{'errors':>8}")
+    everything = []
+    for action in ACTIONS:
+        samples = latencies.get(action, [])
+        everything.extend(samples)
+        print(f"{action:<20}{len(samples):>9}{len(samples) / elapsed:>9.1f}"
+              f"{percentile(samples, 50):>9.1f}{percentile(samples, 95):>9.1f}"
+              f"{percentile(samples, 99):>9.1f}{errors.get(action, 0):>8}")
+    print(f"{'all':<20}{len(everything):>9}{len(everything) / elapsed:>9.1f}"
+          f"{percentile(everything, 50):>9.1f}{percentile(everything, 95):>9.1f}"
+          f"{percentile(everything, 99):>9.1f}{sum(errors.values()):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test StudentMart through the Flask test client.")
+    parser.add_argument("--db", help="existing database (default: generate one)")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds")
+    parser.add_argument("--products", type=int, default=20_000, help="when generating")
+    parser.add_argument("--users", type=int, default=5_000, help="when generating")
+    parser.add_argument("--orders", type=int, default=50_000, help="when generating")
+    args = parser.parse_args()
+
+    if args.db:
+        os.environ["STUDENTMART_DB"] = os.path.abspath(args.db)
+    else:
+        from bench.datagen import generate
+
+        db_path = use_scratch_database("load.db")
+        generate(db_path, products=args.products, users=args.users, orders=args.orders,
+                 carts=min(1_000, args.users))
+
+    import sqlite3
+    conn = sqlite3.connect(os.environ["STUDENTMART_DB"])
+    product_count = conn.execute("SELECT MAX(id) FROM products").fetchone()[0] or 1
+    category_count = conn.execute("SELECT MAX(id) FROM categories").fetchone()[0] or 1
+    user_count = conn.execute("SELECT MAX(id) FROM users").fetchone()[0] or 1
+    conn.close()
+
+    from app import app
+    app.config["WTF_CSRF_ENABLED"] = False
+
+    print(f"{args.threads} threads for {args.duration:.0f}s against {os.environ['STUDENTMART_DB']}")
+    elapsed, latencies, errors = run(app, args.threads, args.duration,
+                                     product_count, category_count, user_count)
+    report(elapsed, latencies, errors)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import argparse
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.common import create_schema, percentile, use_scratch_database
+
+# Login burst with concurrent catalog browsing.
+#
+#   python -m bench.login [--login-threads N] [--logins-per-thread N]
+#
+# Runs the same burst twice: hashing inline on the request thread (the old
+# behaviour) and on the bounded hashing pool in db/db.py. Reports login
+# latency, logins turned away with PasswordHashingBusy, and the latency of
+# catalog reads made while the burst is running.
+
+USERS = 200
+BROWSERS = 4
+
+
+def build(db_path, password_hash):
+    create_schema(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO categories (name) VALUES ('Bench')")
+    conn.executemany("INSERT INTO users (username, password) VALUES (?, ?)",
+                     [(f"user{i}", password_hash) for i in range(USERS)])
+    conn.executemany(
+        "INSERT INTO products (user, category, name, price, stock) VALUES (1, 1, ?, 1.0, 10)",
+        [(f"Product {i}",) for i in range(2000)],
+    )
+    conn.commit()
+    conn.close()
+
+
+def burst(db, login_threads, logins_per_thread):
+    login_ms, browse_ms, busy = [], [], [0]
+    done = threading.Event()
+
+    def login(worker):
+        for n in range(logins_per_thread):
+            started = time.perf_counter()
+            try:
+                ok = db.validate_login(f"user{(worker * logins_per_thread + n) % USERS}", "password")
+                assert ok is not None
+            except db.PasswordHashingBusy:
+                busy[0] += 1
+                continue
+            login_ms.append((time.perf_counter() - started) * 1000)
+
+    def browse():
+        while not done.is_set():
+            started = time.perf_counter()
+            db.get_all_products(limit=13)
+            browse_ms.append((time.perf_counter() - started) * 1000)
+            time.sleep(0.005)
+
+    browsers = [threading.Thread(target=browse) for _ in range(BROWSERS)]
+    for t in browsers:
+        t.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=login_threads) as pool:
+        list(pool.map(login, range(login_threads)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    for t in browsers:
+        t.join()
+    return elapsed, login_ms, busy[0], browse_ms
+
+
+def main(login_threads=16, logins_per_thread=5):
+    db_path = use_scratch_database("login.db")
+    from db import db
+    from werkzeug.security import generate_password_hash
+
+    build(db_path, generate_password_hash("password", db.PASSWORD_HASH_METHOD))
+    db.catalog_cache.enabled = False  # every browse hits SQLite
+
+    pooled = db._hashing
+    modes = (
+        ("inline", lambda fn, *args: fn(*args)),
+        (f"pool ({db.HASH_WORKERS}+{db.HASH_QUEUE})", pooled),
+    )
+    total = login_threads * logins_per_thread
+    print(f"{total} logins from {login_threads} threads, {db.PASSWORD_HASH_METHOD}, "
+          f"{BROWSERS} browsing threads")
+    print(f"{'':<14}{'login/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'busy':>6}{'browse p50':>12}{'browse p99':>12}")
+    for label, hashing in modes:
+        db._hashing = hashing
+        elapsed, login_ms, busy, browse_ms = burst(db, login_threads, logins_per_thread)
+        print(f"{label:<14}{len(login_ms) / elapsed:>9.1f}{percentile(login_ms, 50):>9.0f}"
+              f"{percentile(login_ms, 95):>9.0f}{percentile(login_ms, 99):>9.0f}{busy:>6}"
+              f"{percentile(browse_ms, 50):>12.1f}{percentile(browse_ms, 99):>12.1f}")
+    db._hashing = pooled
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Login burst with concurrent catalog browsing.")
+    parser.add_argument("--login-threads", type=int, default=16)
+    parser.add_argument("--logins-per-thread", type=int, default=5)
+    args = parser.parse_args()
+    main(args.login_threads, args.logins_per_thread)
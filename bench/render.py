@@ -0,0 +1,107 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from bench.common import use_scratch_database
+
+# Template cost for index.html, products.html and cart.html.
+#
+#   python -m bench.render [--renders N]        default 2000 per template
+#
+# "load": getting the template (and base.html) into a fresh worker, either
+# compiled from source or read from the Jinja bytecode cache. "render":
+# render_template with the page's usual context, once with the CSRF token
+# generated on every render (the old context processor) and once with
+# the lazy token app.py now uses.
+
+TEMPLATES = ("index.html", "products.html", "cart.html")
+
+
+def contexts(db):
+    user_id = 2
+    for product in db.get_all_products(limit=3):
+        db.cart_add_item(user_id, product["id"], 2)
+    items = db.cart_get_items(user_id)
+    products = db.get_all_products(limit=12)
+    return user_id, {
+        "index.html": dict(products=products, next_cursor="x", prev_cursor=None),
+        "products.html": dict(title="Products", categories=db.get_all_categories(),
+                              products=products, selected_category=None,
+                              selected_price=None, in_stock=False,
+                              facets=db.product_facet_counts(), price_bands=db.PRICE_BANDS,
+                              next_cursor="x", prev_cursor=None),
+        "cart.html": dict(title="Your Cart", cart_items=items,
+                          total=sum(row["price"] * row["quantity"] for row in items)),
+    }
+
+
+def load_times(app, bytecode_cache):
+    env = app.jinja_env
+    env.bytecode_cache = bytecode_cache
+    times = {}
+    for name in TEMPLATES:
+        env.cache.clear()  # as in a new worker
+        started = time.perf_counter()
+        env.get_template(name)
+        env.get_template("base.html")
+        times[name] = (time.perf_counter() - started) * 1000
+    return times
+
+
+def render_rate(app, name, context, user_id, renders, eager):
+    from flask import render_template, session
+    from flask_wtf.csrf import generate_csrf
+
+    if eager:
+        processor = lambda: {"csrf_token": generate_csrf()}
+        app.template_context_processors[None].append(processor)
+    try:
+        started = time.perf_counter()
+        for _ in range(renders):
+            # a request context each time: the CSRF token is per request
+            with app.test_request_context("/"):
+                session["user_id"] = user_id
+                render_template(name, **context)
+        return renders / (time.perf_counter() - started)
+    finally:
+        if eager:
+            app.template_context_processors[None].remove(processor)
+
+
+def main(renders=2000):
+    db_path = use_scratch_database("render.db")
+    # After use_scratch_database: db.migrate (imported by datagen) reads
+    # STUDENTMART_DB on import, and app.py migrates that file
+    from bench.datagen import generate
+
+    generate(db_path, products=2_000, categories=20, users=100, orders=500, carts=0,
+             verbose=False)
+    cache_dir = tempfile.mkdtemp(prefix="studentmart-jinja-")
+    os.environ["STUDENTMART_JINJA_CACHE"] = cache_dir
+    from jinja2 import FileSystemBytecodeCache
+
+    from app import app
+    from db import db
+
+    user_id, pages = contexts(db)
+    with app.test_request_context("/"):
+        compiled = load_times(app, None)
+        load_times(app, FileSystemBytecodeCache(cache_dir))  # fills the cache
+        cached = load_times(app, FileSystemBytecodeCache(cache_dir))
+
+    print(f"{'':<16}{'compile ms':>11}{'bytecode ms':>12}{'eager csrf/s':>14}{'lazy csrf/s':>13}")
+    for name in TEMPLATES:
+        lazy = render_rate(app, name, pages[name], user_id, renders, eager=False)
+        eager = render_rate(app, name, pages[name], user_id, renders, eager=True)
+        print(f"{name:<16}{compiled[name]:>11.2f}{cached[name]:>12.2f}{eager:>14.0f}{lazy:>13.0f}")
+    db.close_db_connection()
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Template load and render cost.")
+    parser.add_argument("--renders", type=int, default=2000, help="per template")
+    args = parser.parse_args()
+    main(args.renders)
@@ -0,0 +1,95 @@
+import argparse
+import random
+import sqlite3
+import time
+
+from bench.common import create_schema, use_scratch_database
+from bench.datagen import ADJECTIVES, NOUNS, brands
+
+# Compare search_products on the FTS5 index against the LIKE fallback.
+#
+#   python -m bench.search [--products N] [--rounds N]
+#
+# Builds a throwaway database from db/schema.sql + migrations, so the real
+# db/database.db is never touched.
+
+# (label, query); hit counts are printed alongside the timings
+QUERIES = [
+    ("common word", "rice"),
+    ("prefix", "cof"),
+    ("two words", "basmati rice"),
+    ("brand", None),          # filled in with a generated brand name
+    ("no match", "quinoa"),
+]
+
+
+def build_catalog(db_path, products):
+    create_schema(db_path)  # includes products_fts and its triggers
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO users (username, password) VALUES ('bench', 'x')")
+    conn.executemany("INSERT INTO categories (name) VALUES (?)",
+                     [(f"Category {i}",) for i in range(1, 21)])
+
+    rnd = random.Random(42)
+    brand_names = brands()
+    rows = []
+    for _ in range(products):
+        brand, adjective, noun = rnd.choice(brand_names), rnd.choice(ADJECTIVES), rnd.choice(NOUNS)
+        rows.append((
+            rnd.randint(1, 20),
+            f"{brand} {adjective} {noun}".title(),
+            f"{adjective.capitalize()} {noun} by {brand.capitalize()}. "
+            f"Pairs well with {rnd.choice(NOUNS)}.",
+            round(rnd.uniform(0.5, 80), 2),
+            rnd.randint(0, 100),
+        ))
+    conn.executemany(
+        """
+        INSERT INTO products (user, category, name, description, price, stock)
+        VALUES (1, ?, ?, ?, ?, ?)
+        """,
+        rows,
+    )
+    conn.commit()
+    conn.close()
+    return brand_names
+
+
+def timed(fn, query, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn(query, limit=12)
+    return (time.perf_counter() - started) / rounds * 1000
+
+
+def main(products=100_000, rounds=20):
+    db_path = use_scratch_database()
+    from db import db
+
+    print(f"Building {products} products in {db_path} ...")
+    brand_names = build_catalog(db_path, products)
+    queries = [(label, q or brand_names[0]) for label, q in QUERIES]
+
+    results = []
+    for label, query in queries:
+        db._fts_ready = None
+        fts_ms = timed(db.search_products, query, rounds)
+        db._fts_ready = False  # force the LIKE fallback
+        like_ms = timed(db.search_products, query, rounds)
+        results.append((label, query, fts_ms, like_ms))
+    db.close_db_connection()
+
+    print(f"{'query':<28}{'FTS5 ms':>10}{'LIKE ms':>10}{'speedup':>10}")
+    for label, query, fts_ms, like_ms in results:
+        print(f"{label + ' (' + query + ')':<28}{fts_ms:>10.2f}{like_ms:>10.2f}"
+              f"{like_ms / fts_ms:>9.1f}x")
+    print(f"{'worst case':<28}{max(r[2] for r in results):>10.2f}"
+          f"{max(r[3] for r in results):>10.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="search_products on FTS5 vs the LIKE fallback.")
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    main(args.products, args.rounds)
@@ -0,0 +1,107 @@
+import argparse
+import random
+import sqlite3
+import threading
+import time
+
+from bench.common import percentile, use_scratch_database
+from bench.datagen import generate
+
+# Catalog reads from the database file vs the in-memory snapshot
+# (CatalogSnapshot, STUDENTMART_CATALOG_SNAPSHOT=1).
+#
+#   python -m bench.snapshot [--products N] [--threads N] [--seconds N]
+#
+# Reader threads mix first-page listings (all / by category) with product
+# lookups, catalog_cache off so every call reaches SQLite. Each mode runs
+# quiet and with a writer standing in for checkouts in other workers
+# (orders plus stock updates on the file, every WRITE_EVERY seconds), which
+# keeps the WAL busy and makes the snapshot copy changed stock over every
+# check interval (a full reload only follows catalog edits).
+
+WRITE_EVERY = 0.02
+
+
+def writer(db_path, stop, products):
+    rnd = random.Random(3)
+    conn = sqlite3.connect(db_path, timeout=5)
+    conn.execute("PRAGMA journal_mode = WAL")
+    while not stop.wait(WRITE_EVERY):
+        product_id = rnd.randint(1, products)
+        conn.execute("INSERT INTO orders (user_id, total, status) VALUES (1, 1.0, 'placed')")
+        conn.execute("UPDATE products SET stock = stock + 1 WHERE id = ?", (product_id,))
+        conn.commit()
+    conn.close()
+
+
+def run(db, threads, seconds, products, categories):
+    stop = threading.Event()
+    latencies = [[] for _ in range(threads)]
+
+    def reader(index):
+        rnd = random.Random(index)
+        samples = latencies[index]
+        while not stop.is_set():
+            started = time.perf_counter()
+            kind = rnd.random()
+            if kind < 0.3:
+                db.get_all_products(limit=12)
+            elif kind < 0.6:
+                db.get_all_products(category_id=rnd.randint(1, categories), limit=12)
+            else:
+                db.get_product_by_id(rnd.randint(1, products))
+            samples.append((time.perf_counter() - started) * 1000)
+        db.close_db_connection()
+
+    workers = [threading.Thread(target=reader, args=(i,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in workers:
+        t.join()
+    return [ms for samples in latencies for ms in samples]
+
+
+def main(products=100_000, threads=8, seconds=10):
+    db_path = use_scratch_database("snapshot.db")
+    categories = 40
+    generate(db_path, products=products, categories=categories, users=1_000, orders=10_000,
+             carts=0, verbose=False)
+    from db import db
+
+    db.catalog_cache.enabled = False
+    snapshot = db.catalog_snapshot
+    print(f"{products} products, {threads} reader threads, {seconds}s per run, "
+          f"snapshot checked every {snapshot.check_interval:.0f}s")
+    print(f"{'':<24}{'reads/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'reloads':>9}{'load s':>8}{'syncs':>7}")
+    for writes in (False, True):
+        for mode in ("file", "snapshot"):
+            snapshot.enabled = mode == "snapshot"
+            loads, load_seconds = snapshot.loads, snapshot.load_seconds
+            syncs = snapshot.stock_syncs
+            if snapshot.enabled:
+                snapshot.refresh()
+            stop = threading.Event()
+            background = threading.Thread(target=writer, args=(db_path, stop, products))
+            if writes:
+                background.start()
+            samples = run(db, threads, seconds, products, categories)
+            stop.set()
+            if writes:
+                background.join()
+            reloads = snapshot.loads - loads
+            per_load = (snapshot.load_seconds - load_seconds) / reloads if reloads else 0.0
+            label = f"{mode}, {'writes' if writes else 'quiet'}"
+            print(f"{label:<24}{len(samples) / seconds:>10.0f}{percentile(samples, 50):>9.2f}"
+                  f"{percentile(samples, 99):>9.2f}{reloads:>9}{per_load:>8.2f}"
+                  f"{snapshot.stock_syncs - syncs:>7}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Catalog reads from the file vs the in-memory snapshot.")
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seconds", type=int, default=10, help="per run")
+    args = parser.parse_args()
+    main(args.products, args.threads, args.seconds)
@@ -0,0 +1,102 @@
+import argparse
+import random
+import shutil
+import sqlite3
+import threading
+import time
+
+from bench.checkout import PRODUCTS, build
+from bench.common import percentile, use_scratch_database
+
+# Concurrent cart and checkout writes: per-call commits vs the group-commit
+# writer (GroupCommitWriter, STUDENTMART_WRITE_QUEUE=1).
+#
+#   python -m bench.writes [--threads N] [--seconds N]
+#
+# Every thread plays a shopper: three cart adds, a quantity change, then a
+# checkout, over and over. Both modes run on copies of the same database,
+# with and without PRAGMA synchronous = FULL (an fsync per commit, where
+# batching commits matters most).
+
+USERS = 2_000
+STOCK = 1_000_000
+
+
+def shopper(db, index, stop, latencies, errors):
+    rnd = random.Random(index)
+    while not stop.is_set():
+        user_id = rnd.randint(1, USERS)
+        steps = [("cart", db.cart_add_item, (user_id, rnd.randint(1, PRODUCTS), 1))
+                 for _ in range(3)]
+        steps.append(("cart", db.cart_update_quantity, (user_id, rnd.randint(1, PRODUCTS), 2)))
+        steps.append(("checkout", db.order_create_from_cart, (user_id,)))
+        for kind, fn, args in steps:
+            started = time.perf_counter()
+            try:
+                fn(*args)
+            except (sqlite3.Error, db.WriteQueueBusy, db.OutOfStockError):
+                errors[kind] = errors.get(kind, 0) + 1
+                continue
+            latencies.setdefault(kind, []).append((time.perf_counter() - started) * 1000)
+    db.close_db_connection()
+
+
+def run(db, threads, seconds):
+    stop = threading.Event()
+    results = [({}, {}) for _ in range(threads)]
+    workers = [threading.Thread(target=shopper, args=(db, i, stop, *results[i]))
+               for i in range(threads)]
+    for t in workers:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in workers:
+        t.join()
+    latencies, errors = {}, {}
+    for lat, err in results:
+        for kind, samples in lat.items():
+            latencies.setdefault(kind, []).extend(samples)
+        for kind, count in err.items():
+            errors[kind] = errors.get(kind, 0) + count
+    return latencies, errors
+
+
+def main(threads=16, seconds=10):
+    scratch = use_scratch_database("writes.db")
+    build(scratch, USERS, STOCK)
+    from db import db
+
+    print(f"{threads} threads, {seconds}s per run, {USERS} users, {PRODUCTS} products")
+    print(f"{'':<30}{'writes/s':>9}{'cart p50':>9}{'p99':>8}{'chk p50':>9}{'p99':>8}"
+          f"{'errors':>8}{'per commit':>11}")
+    for synchronous in ("NORMAL", "FULL"):
+        pragmas = db.CONNECTION_PRAGMAS
+        db.CONNECTION_PRAGMAS = tuple(
+            f"PRAGMA synchronous = {synchronous}" if p.startswith("PRAGMA synchronous") else p
+            for p in pragmas
+        )
+        for mode in ("per-call commit", "group commit"):
+            path = scratch.replace("writes.db", f"{synchronous}-{mode.split()[0]}.db")
+            shutil.copy(scratch, path)
+            db.DB_PATH = path
+            db.write_queue.enabled = mode == "group commit"
+            commits, writes = db.write_queue.commits, db.write_queue.writes
+            latencies, errors = run(db, threads, seconds)
+            total = sum(len(samples) for samples in latencies.values())
+            cart, checkout = latencies.get("cart", []), latencies.get("checkout", [])
+            batched = db.write_queue.writes - writes
+            per_commit = batched / (db.write_queue.commits - commits) if batched else 1.0
+            label = f"{mode}, sync={synchronous}"
+            print(f"{label:<30}{total / seconds:>9.0f}"
+                  f"{percentile(cart, 50):>9.1f}{percentile(cart, 99):>8.1f}"
+                  f"{percentile(checkout, 50):>9.1f}{percentile(checkout, 99):>8.1f}"
+                  f"{sum(errors.values()):>8}{per_commit:>11.1f}")
+        db.CONNECTION_PRAGMAS = pragmas
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent cart and checkout writes: per-call vs group commit.")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--seconds", type=int, default=10, help="per run")
+    args = parser.parse_args()
+    main(args.threads, args.seconds)
@@ -0,0 +1,245 @@
+import argparse
+import csv
+import io
+import json
+import math
+import sys
+import time
+
+# Bulk product import/export as CSV or JSON Lines, streamed row by row.
+#
+#   python catalog_io.py import FILE [--create-categories] [--user ID]
+#   python catalog_io.py export FILE [--format csv|jsonl]      (- for stdout)
+#
+# Columns: id, sku, name, description, price, stock, category, image_url.
+# category is a category name; name, price and category are required. A row
+# with an id or sku that already exists updates that product (only if it
+# belongs to the importing user, like the edit form; other users' products
+# are reported and skipped), other rows are inserted, and empty optional
+# columns keep their current value. Rows
+# are written CHUNK_SIZE at a time, one transaction per chunk; bad rows
+# are reported and skipped. An export can be re-imported as is.
+
+FIELDS = ("id", "sku", "name", "description", "price", "stock", "category", "image_url")
+FORMATS = ("csv", "jsonl")
+CHUNK_SIZE = 1000
+MAX_ERRORS = 100  # kept for the report; all are counted
+MAX_NAME = 200
+MAX_SKU = 64
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.written = 0
+        self.failed = 0
+        self.errors = []  # (line, message), first MAX_ERRORS only
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((line, message))
+
+    @property
+    def rate(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+def detect_format(filename, default="csv"):
+    name = (filename or "").lower()
+    if name.endswith((".jsonl", ".ndjson", ".json")):
+        return "jsonl"
+    if name.endswith(".csv"):
+        return "csv"
+    return default
+
+
+def read_rows(stream, fmt):
+    # Yields (line number, dict) from a text stream
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_no, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_no, ValueError(f"invalid JSON: {e}")
+            continue
+        yield line_no, row if isinstance(row, dict) else ValueError("expected a JSON object")
+
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _number(value, kind, field):
+    text = _text(value)
+    if text is None:
+        return None
+    try:
+        number = kind(text)
+    except ValueError:
+        raise ValueError(f"{field} is not a valid number: {text!r}") from None
+    if isinstance(number, float) and not math.isfinite(number):
+        raise ValueError(f"{field} is not a valid number: {text!r}")
+    if number < 0:
+        raise ValueError(f"{field} cannot be negative")
+    return number
+
+
+def clean_row(raw):
+    # Validated row for bulk_upsert_products, with the category still a
+    # name; raises ValueError with a message for the report
+    row = {
+        "id": _number(raw.get("id"), int, "id"),
+        "sku": _text(raw.get("sku")),
+        "name": _text(raw.get("name")),
+        "description": _text(raw.get("description")),
+        "price": _number(raw.get("price"), float, "price"),
+        "stock": _number(raw.get("stock"), int, "stock"),
+        "category": _text(raw.get("category")),
+        "image_url": _text(raw.get("image_url")),
+    }
+    if row["name"] is None:
+        raise ValueError("name is required")
+    if len(row["name"]) > MAX_NAME:
+        raise ValueError(f"name is longer than {MAX_NAME} characters")
+    if row["sku"] is not None and len(row["sku"]) > MAX_SKU:
+        raise ValueError(f"sku is longer than {MAX_SKU} characters")
+    if row["price"] is None:
+        raise ValueError("price is required")
+    if row["category"] is None:
+        raise ValueError("category is required")
+    return row
+
+
+def import_products(stream, fmt, user_id, create_categories=False, progress=None,
+                    chunk_size=CHUNK_SIZE):
+    from db.db import bulk_upsert_products, resolve_categories
+
+    report = ImportReport()
+    categories = resolve_categories(())
+    chunk, lines = [], []
+
+    def flush():
+        wanted = {row["category"] for row in chunk if row["category"].casefold() not in categories}
+        if wanted:
+            categories.update(resolve_categories(wanted, create_missing=create_categories))
+        batch, batch_lines = [], []
+        for line, row in zip(lines, chunk):
+            category_id = categories.get(row["category"].casefold())
+            if category_id is None:
+                report.error(line, f"unknown category {row['category']!r}")
+                continue
+            batch.append(dict(row, category=category_id))
+            batch_lines.append(line)
+        failures = bulk_upsert_products(user_id, batch) if batch else []
+        for index, message in failures:
+            report.error(batch_lines[index], message)
+        report.written += len(batch) - len(failures)
+        chunk.clear()
+        lines.clear()
+        report.elapsed = time.perf_counter() - report.started
+        if progress:
+            progress(report)
+
+    for line, raw in read_rows(stream, fmt):
+        report.rows += 1
+        try:
+            if isinstance(raw, Exception):
+                raise raw
+            chunk.append(clean_row(raw))
+            lines.append(line)
+        except ValueError as e:
+            report.error(line, str(e))
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+    report.elapsed = time.perf_counter() - report.started
+    return report
+
+
+def export_products_text(fmt, stats=None):
+    # Yields the catalog as CSV / JSON Lines text, a few hundred rows per
+    # chunk, without building the whole file; stats["rows"] counts rows
+    from db.db import export_products
+
+    stats = {} if stats is None else stats
+    stats["rows"] = 0
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == "csv" else None
+    if writer:
+        writer.writerow(FIELDS)
+    for row in export_products():
+        stats["rows"] += 1
+        if writer:
+            writer.writerow(["" if row[f] is None else row[f] for f in FIELDS])
+        else:
+            buffer.write(json.dumps({f: row[f] for f in FIELDS}, ensure_ascii=False) + "\n")
+        if stats["rows"] % 500 == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _print_progress(report):
+    print(f"  {report.rows:>9} rows  {report.written:>9} written  {report.failed:>6} failed"
+          f"  {report.rate:>8.0f} rows/s", end="\r", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import/export StudentMart products.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_import = sub.add_parser("import", help="import products from CSV or JSON Lines")
+    p_import.add_argument("file")
+    p_import.add_argument("--format", choices=FORMATS)
+    p_import.add_argument("--create-categories", action="store_true",
+                          help="create categories that do not exist yet")
+    p_import.add_argument("--user", type=int, default=1,
+                          help="importing user: owns new products, only their products are updated")
+    p_export = sub.add_parser("export", help="export the catalog")
+    p_export.add_argument("file", help="- for stdout")
+    p_export.add_argument("--format", choices=FORMATS)
+    args = parser.parse_args()
+
+    from db.migrate import migrate
+
+    migrate()  # as app.py does on startup: the import needs the sku column
+    fmt = args.format or detect_format(args.file)
+    if args.command == "import":
+        with open(args.file, encoding="utf-8-sig", newline="") as f:
+            report = import_products(f, fmt, args.user, args.create_categories,
+                                     progress=_print_progress)
+        print(file=sys.stderr)
+        for line, message in report.errors:
+            print(f"line {line}: {message}", file=sys.stderr)
+        print(f"{report.rows} rows, {report.written} written, {report.failed} failed "
+              f"in {report.elapsed:.1f}s ({report.rate:.0f} rows/s)")
+        sys.exit(1 if report.failed else 0)
+
+    started, stats = time.perf_counter(), {}
+    out = sys.stdout if args.file == "-" else open(args.file, "w", encoding="utf-8", newline="")
+    try:
+        for text in export_products_text(fmt, stats):
+            out.write(text)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    rows, elapsed = stats["rows"], time.perf_counter() - started
+    print(f"exported {rows} products in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):.0f} rows/s)",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
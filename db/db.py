@@ -1,164 +1,1146 @@
+import base64
+import json
 import os
+import queue
+import re
 import sqlite3
-from flask import abort
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from flask import abort, g, has_app_context
 from werkzeug.security import check_password_hash, generate_password_hash
 
+from db.migrate import ORDER_LINE_CATEGORY, PRICE_BANDS
+
 __all__ = [
     "get_db_connection",
+    "close_db_connection",
     "create_user",
+    "PasswordHashingBusy",
     "validate_login",
     "get_user_by_username",
     "get_user_by_id",
     "get_all_categories",
     "get_all_products",
+    "product_facet_counts",
+    "PRICE_BANDS",
     "get_product_by_id",
     "create_product",
     "update_product",
-    "delete_product","cart_add_item",
+    "delete_product",
+    "set_image_variants",
+    "resolve_categories",
+    "bulk_upsert_products",
+    "export_products",
+    "cart_add_item",
     "cart_get_items",
     "cart_update_quantity",
+    "cart_apply",
+    "CART_OPS",
     "cart_clear",
     "order_create_from_cart",
+    "OutOfStockError",
     "order_get",
     "order_get_items",
     "orders_for_user",
+    "order_get_with_items",
+    "export_order_lines",
+    "sales_by_day",
+    "sales_by_category",
+    "top_products",
+    "related_products",
     "search_products",
+    "catalog_names",
     "is_user_admin",
-
+    "set_user_admin",
+    "get_role_epoch",
+    "get_catalog_version",
+    "get_catalog_last_changed",
+    "PRODUCT_FIELDS",
+    "encode_cursor",
+    "catalog_cache",
+    "catalog_snapshot",
+    "CatalogCache",
+    "on_catalog_change",
+    "on_query",
+    "on_connection_open",
+    "write_queue",
+    "WriteQueueBusy",
 ]
 
-def get_db_connection():
-    # DB is stored in db/database.db (absolute path to avoid OneDrive issues)
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    db_path = os.path.join(base_dir, "database.db")
-    conn = sqlite3.connect(db_path)
+# DB is stored in db/database.db (absolute path to avoid OneDrive issues).
+# STUDENTMART_DB points the app at another file (benchmarks, scratch copies).
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.environ.get("STUDENTMART_DB", os.path.join(BASE_DIR, "database.db"))
+
+# Applied once when a connection is opened, not per query
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA cache_size = -16000",      # ~16 MB page cache
+    "PRAGMA mmap_size = 268435456",    # 256 MB memory-mapped reads
+    "PRAGMA temp_store = MEMORY",
+)
+
+# Connections used outside a Flask app context (scripts, worker threads)
+_local = threading.local()
+
+# ---------- Query instrumentation ----------
+# on_query(callback(sql, params, seconds)) sees every statement run through
+# a connection, timed from execute until its rows have been fetched (or the
+# cursor is dropped); COMMIT is reported as a statement of its own.
+# on_connection_open(callback(seconds)) sees each new connection and the
+# time spent opening it and applying CONNECTION_PRAGMAS. Until a query
+# callback is registered connections are plain sqlite3 ones, so the
+# instrumentation costs nothing when unused (metrics.py registers them).
+_query_listeners = []
+_open_listeners = []
+
+def on_query(callback):
+    _query_listeners.append(callback)
+    return callback
+
+def on_connection_open(callback):
+    _open_listeners.append(callback)
+    return callback
+
+def _report_query(sql, params, seconds):
+    for callback in _query_listeners:
+        callback(sql, params, seconds)
+
+class _TimedCursor(sqlite3.Cursor):
+    _statement = None  # [sql, params, seconds] until the rows are consumed
+
+    def _timed(self, fn, *args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            if self._statement is not None:
+                self._statement[2] += time.perf_counter() - started
+
+    def _finish(self):
+        statement, self._statement = self._statement, None
+        if statement is not None:
+            _report_query(*statement)
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        self._statement = [sql, parameters, 0.0]
+        return self._timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        self._statement = [sql, None, 0.0]
+        return self._timed(super().executemany, sql, seq_of_parameters)
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(super().fetchmany, self.arraysize if size is None else size)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            return self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+class _TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=_TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        if not self.in_transaction:
+            return super().commit()
+        started = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            _report_query("COMMIT", (), time.perf_counter() - started)
+
+def _open_connection():
+    started = time.perf_counter()
+    conn = sqlite3.connect(DB_PATH, factory=_TimedConnection if _query_listeners else sqlite3.Connection)
     conn.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        # Part of opening the connection, not reported as queries
+        sqlite3.Connection.execute(conn, pragma)
+    for callback in _open_listeners:
+        callback(time.perf_counter() - started)
+    return conn
+
+def get_db_connection():
+    # One connection per request: bound to the app context and closed in
+    # teardown. Outside a request each thread keeps its own connection.
+    if has_app_context():
+        if "db_conn" not in g:
+            g.db_conn = _open_connection()
+        return g.db_conn
+
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _local.conn = _open_connection()
     return conn
 
+def close_db_connection(exc=None):
+    # Registered with app.teardown_appcontext; also usable from scripts
+    if has_app_context():
+        conn = g.pop("db_conn", None)
+    else:
+        conn = getattr(_local, "conn", None)
+        _local.conn = None
+    if conn is not None:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.close()
+
+# ---------- Group-commit writer ----------
+# With STUDENTMART_WRITE_QUEUE=1, cart, checkout and account writes are not
+# committed by the request thread. They are queued to a single writer thread
+# with its own connection. It takes whatever is waiting (up to WRITE_BATCH,
+# after waiting at most WRITE_BATCH_WAIT for more), runs each write under
+# its own SAVEPOINT inside one BEGIN IMMEDIATE transaction, and commits
+# once. Callers block on a future and get their result or their own
+# exception only after that commit, so a failed write rolls back alone and
+# nothing is reported before it is durable. Requests in this process no
+# longer queue on SQLite's write lock; separate processes still take
+# turns. A full queue, or a write not started within WRITE_TIMEOUT,
+# raises WriteQueueBusy.
+WRITE_BATCH = 64
+WRITE_BATCH_WAIT = 0.0  # seconds; > 0 trades latency for bigger batches
+WRITE_QUEUE_SIZE = 1024
+WRITE_TIMEOUT = 10.0
+
+class WriteQueueBusy(Exception):
+    pass
+
+class GroupCommitWriter:
+    def __init__(self, enabled=False, batch=WRITE_BATCH, wait=WRITE_BATCH_WAIT,
+                 size=WRITE_QUEUE_SIZE):
+        self.enabled = enabled
+        self.batch = batch
+        self.wait = wait
+        self.commits = 0
+        self.writes = 0
+        self._queue = queue.Queue(maxsize=size)
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        # Runs fn(conn, *args) on the writer thread; returns its result
+        # once the batch it ran in has committed
+        if self._thread is None:
+            self._start()
+        future = Future()
+        try:
+            self._queue.put_nowait((future, fn, args))
+        except queue.Full:
+            raise WriteQueueBusy() from None
+        try:
+            return future.result(timeout=WRITE_TIMEOUT)
+        except FutureTimeout:
+            if future.cancel():
+                raise WriteQueueBusy() from None
+            return future.result()  # already running, its batch is nearly done
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="group-commit",
+                                                daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        conn, path = None, None
+        while True:
+            jobs = [self._queue.get()]
+            if path != DB_PATH:  # scripts and benchmarks may repoint DB_PATH
+                if conn is not None:
+                    conn.close()
+                conn, path = _open_connection(), DB_PATH
+            deadline = time.monotonic() + self.wait
+            while len(jobs) < self.batch:
+                try:
+                    if self.wait:
+                        job = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    else:
+                        job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                jobs.append(job)
+            self._commit(conn, [job for job in jobs if job[0].set_running_or_notify_cancel()])
+
+    def _commit(self, conn, jobs):
+        if not jobs:
+            return
+        outcomes = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for future, fn, args in jobs:
+                conn.execute("SAVEPOINT write")
+                try:
+                    result = fn(conn, *args)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write")
+                    outcomes.append((future, None, e))
+                else:
+                    outcomes.append((future, result, None))
+                conn.execute("RELEASE write")
+            conn.commit()
+        except Exception as e:
+            # BEGIN or COMMIT failed, or the transaction is unusable: the
+            # whole batch is rolled back and every caller sees the error
+            if conn.in_transaction:
+                conn.rollback()
+            for future, fn, args in jobs:
+                future.set_exception(e)
+            return
+        self.commits += 1
+        self.writes += len(jobs)
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "queued": self._queue.qsize(),
+            "commits": self.commits,
+            "writes": self.writes,
+        }
+
+write_queue = GroupCommitWriter(enabled=os.environ.get("STUDENTMART_WRITE_QUEUE", "0") == "1")
+
+def _write(fn, *args, immediate=False):
+    # fn(conn, *args) makes its changes without committing. Queued to the
+    # writer when enabled, otherwise run and committed on this request's
+    # connection (BEGIN IMMEDIATE first if `immediate`).
+    if write_queue.enabled:
+        return write_queue.submit(fn, *args)
+    conn = get_db_connection()
+    if immediate:
+        conn.execute("BEGIN IMMEDIATE")
+    try:
+        result = fn(conn, *args)
+        conn.commit()
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    return result
+
+# ---------- Catalog read cache ----------
+# Categories, single products and the first page of listings change only
+# through create_product / update_product / delete_product, which invalidate
+# the affected keys. The TTL bounds staleness across worker processes.
+# STUDENTMART_CATALOG_CACHE=0 (or catalog_cache.enabled = False) turns it off.
+
+class CatalogCache:
+    def __init__(self, maxsize=512, ttl=60.0, enabled=True):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, match):
+        # Drop every key for which match(key) is true
+        with self._lock:
+            for key in [k for k in self._data if match(k)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+catalog_cache = CatalogCache(
+    enabled=os.environ.get("STUDENTMART_CATALOG_CACHE", "1") != "0",
+)
+
+def _cached(key, load):
+    # Cached values are lists of sqlite3.Row (immutable rows) or a single
+    # row; lists are copied so callers cannot mutate the shared entry
+    if not catalog_cache.enabled:
+        return load()
+    value = catalog_cache.get(key)
+    if value is None:
+        value = load()
+        if value is not None:
+            catalog_cache.set(key, value)
+    return list(value) if isinstance(value, list) else value
+
+# Callbacks run after every product write with (product_ids, category_ids),
+# for caches kept outside this module (rendered pages, indexes). Bulk
+# writes pass (None, None): anything in the catalog may have changed.
+# Callbacks registered with stock=False skip writes that only changed
+# stock (checkouts, snapshot stock syncs).
+_catalog_listeners = []  # (callback, wants stock-only changes)
+
+def on_catalog_change(callback, stock=True):
+    _catalog_listeners.append((callback, stock))
+    return callback
+
+def _invalidate_products(*product_ids, categories=(), stock_only=False):
+    # Listing keys are ("products", category_id, limit); category None is
+    # the unfiltered listing, which every product write can affect
+    touched = {None, *categories}
+    catalog_cache.invalidate(
+        lambda key: (key[0] == "product" and key[1] in product_ids)
+        or (key[0] == "products" and key[1] in touched)
+    )
+    for callback, stock in _catalog_listeners:
+        if stock or not stock_only:
+            callback(product_ids, tuple(c for c in categories if c is not None))
+
+def _invalidate_catalog():
+    catalog_cache.clear()
+    for callback, _ in _catalog_listeners:
+        callback(None, None)
+
+# ---------- In-memory catalog snapshot ----------
+# With STUDENTMART_CATALOG_SNAPSHOT=1 each process keeps a copy of products
+# and categories (rows and indexes) in a shared-cache in-memory database,
+# and listings, product pages and categories are read from it instead of
+# the database file. The 'catalog' and 'stock' change counters are re-read
+# at most every SNAPSHOT_CHECK_INTERVAL seconds; when another process has
+# changed the catalog, one thread copies it again while the others keep
+# reading the previous copy. When only stock moved (checkouts), just the
+# stock of the products that changed is copied over. Admin writes in this
+# process mark the copy stale so the next read waits for the new one.
+# Search (FTS5) and everything that writes still use the file; checkout
+# re-reads stock there.
+SNAPSHOT_TABLES = ("categories", "products")
+SNAPSHOT_CHECK_INTERVAL = 5.0
+
+class CatalogSnapshot:
+    def __init__(self, enabled=False, check_interval=SNAPSHOT_CHECK_INTERVAL):
+        self.enabled = enabled
+        self.check_interval = check_interval
+        self.loads = 0
+        self.load_seconds = 0.0
+        self.stock_syncs = 0
+        self._current = None  # (uri, catalog version, connection holding it)
+        self._stock_version = None
+        self._next_check = 0.0
+        self._stale = False
+        self._loading = threading.Lock()
+        self._local = threading.local()
+
+    def connection(self):
+        # This thread's read-only connection to the current copy, or None
+        # when disabled (read the file instead)
+        if not self.enabled:
+            return None
+        if self._stale or self._current is None or time.monotonic() >= self._next_check:
+            self.refresh()
+        current = self._current
+        if current is None:
+            return None
+        local = self._local
+        if getattr(local, "uri", None) != current[0]:
+            if getattr(local, "conn", None) is not None:
+                local.conn.close()
+            local.conn = sqlite3.connect(
+                current[0], uri=True,
+                factory=_TimedConnection if _query_listeners else sqlite3.Connection,
+            )
+            local.conn.row_factory = sqlite3.Row
+            sqlite3.Connection.execute(local.conn, "PRAGMA query_only = ON")
+            sqlite3.Connection.execute(local.conn, "PRAGMA read_uncommitted = ON")
+            local.uri = current[0]
+        return local.conn
+
+    def mark_stale(self):
+        self._stale = True
+
+    def refresh(self):
+        # Reload if the catalog changed since the current copy was taken.
+        # Only the first load and reloads after a local write block; other
+        # threads keep the old copy while one thread reloads.
+        if not self._loading.acquire(blocking=self._current is None or self._stale):
+            return
+        try:
+            self._next_check = time.monotonic() + self.check_interval
+            if self._current is not None and not self._stale:
+                catalog, stock = _change_versions("catalog", "stock")
+                if catalog == self._current[1]:
+                    changed = self._sync_stock() if stock != self._stock_version else ()
+                    if changed:
+                        _invalidate_products(*changed, stock_only=True)
+                    return
+            self._stale = False
+            previous, self._current = self._current, self._load()
+        finally:
+            self._loading.release()
+        if previous is not None:
+            previous[2].close()  # threads still on it keep it alive until they move
+            # Cached rows and pages were built from the previous copy
+            _invalidate_catalog()
+
+    def _load(self):
+        started = time.perf_counter()
+        uri = f"file:studentmart-catalog-{os.getpid()}-{self.loads}?mode=memory&cache=shared"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        try:
+            conn.execute("ATTACH DATABASE ? AS disk", (DB_PATH,))
+            # One read transaction: the rows and the version match
+            conn.execute("BEGIN")
+            versions = dict(conn.execute(
+                "SELECT name, version FROM disk.change_counters WHERE name IN ('catalog', 'stock')"
+            ).fetchall())
+            schema = conn.execute(f"""
+                SELECT type, tbl_name, sql FROM disk.sqlite_master
+                WHERE tbl_name IN ({",".join("?" * len(SNAPSHOT_TABLES))})
+                  AND type IN ('table', 'index') AND sql IS NOT NULL
+                ORDER BY type = 'index'
+            """, SNAPSHOT_TABLES).fetchall()
+            for kind, table, sql in schema:
+                conn.execute(sql)
+                if kind == "table":
+                    conn.execute(f"INSERT INTO main.{table} SELECT * FROM disk.{table}")
+            conn.commit()
+            conn.execute("DETACH DATABASE disk")
+            conn.execute("ANALYZE")
+        except BaseException:
+            conn.close()
+            raise
+        self.loads += 1
+        self.load_seconds += time.perf_counter() - started
+        self._stock_version = versions.get("stock", 0)
+        return uri, versions.get("catalog", 0), conn
+
+    def _sync_stock(self):
+        # Copies stock that changed on disk into the current copy; returns
+        # the ids of those products
+        conn = self._current[2]
+        conn.execute("ATTACH DATABASE ? AS disk", (DB_PATH,))
+        try:
+            conn.execute("BEGIN")
+            version = conn.execute(
+                "SELECT version FROM disk.change_counters WHERE name='stock'"
+            ).fetchone()
+            changed = conn.execute("""
+                SELECT disk_products.stock, disk_products.id
+                FROM main.products
+                JOIN disk.products AS disk_products ON disk_products.id = main.products.id
+                WHERE disk_products.stock IS NOT main.products.stock
+            """).fetchall()
+            conn.executemany("UPDATE main.products SET stock = ? WHERE id = ?", changed)
+            conn.commit()
+        finally:
+            conn.execute("DETACH DATABASE disk")
+        self.stock_syncs += 1
+        self._stock_version = version[0] if version else 0
+        return [product_id for _, product_id in changed]
+
+    def stats(self):
+        current = self._current
+        return {
+            "enabled": self.enabled,
+            "version": current[1] if current else None,
+            "loads": self.loads,
+            "load_seconds": self.load_seconds,
+            "stock_syncs": self.stock_syncs,
+        }
+
+catalog_snapshot = CatalogSnapshot(
+    enabled=os.environ.get("STUDENTMART_CATALOG_SNAPSHOT", "0") == "1",
+)
+
+def _catalog_connection():
+    return catalog_snapshot.connection() or get_db_connection()
+
 # ---------- Auth ----------
+# Password hashing is deliberately slow and CPU-bound. It runs on a small
+# pool (HASH_WORKERS threads) so a burst of logins or registrations cannot
+# tie up every request thread; once HASH_WORKERS + HASH_QUEUE hashes are in
+# flight, further attempts fail fast with PasswordHashingBusy instead of
+# queueing behind them. The method string is werkzeug's, e.g.
+# "scrypt:32768:8:1" or "pbkdf2:sha256:600000"; stored hashes made with
+# other parameters are upgraded on the next successful login.
+PASSWORD_HASH_METHOD = os.environ.get("STUDENTMART_HASH_METHOD", "scrypt:32768:8:1")
+HASH_WORKERS = int(os.environ.get("STUDENTMART_HASH_WORKERS", "2"))
+HASH_QUEUE = int(os.environ.get("STUDENTMART_HASH_QUEUE", "16"))
+HASH_TIMEOUT = 5.0  # seconds a request waits for its hash
+
+class PasswordHashingBusy(Exception):
+    pass
+
+_hash_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="hashing")
+_hash_slots = threading.BoundedSemaphore(HASH_WORKERS + HASH_QUEUE)
+_hash_prefix = None
+
+def _hashing(fn, *args):
+    if not _hash_slots.acquire(blocking=False):
+        raise PasswordHashingBusy()
+    try:
+        future = _hash_executor.submit(fn, *args)
+    except Exception:
+        _hash_slots.release()
+        raise
+    future.add_done_callback(lambda _: _hash_slots.release())
+    try:
+        return future.result(timeout=HASH_TIMEOUT)
+    except FutureTimeout:
+        raise PasswordHashingBusy() from None
+
+def _hash_password(password):
+    return _hashing(generate_password_hash, password, PASSWORD_HASH_METHOD)
+
+def _needs_rehash(stored_hash):
+    # werkzeug fills in defaults ("pbkdf2" -> "pbkdf2:sha256:<n>"), so learn
+    # the full prefix from one real hash
+    global _hash_prefix
+    if _hash_prefix is None:
+        _hash_prefix = generate_password_hash("", PASSWORD_HASH_METHOD).split("$", 1)[0]
+    return stored_hash.split("$", 1)[0] != _hash_prefix
+
 def create_user(username, password):
-    hashed = generate_password_hash(password)
-    conn = get_db_connection()
-    conn.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, hashed))
-    conn.commit()
-    conn.close()
+    hashed = _hash_password(password)
+    _write(lambda conn: conn.execute("INSERT INTO users (username, password) VALUES (?, ?)",
+                                     (username, hashed)))
 
 def validate_login(username, password):
     user = get_user_by_username(username)
-    if user and check_password_hash(user["password"], password):
-        return user
-    return None
+    if not user or not _hashing(check_password_hash, user["password"], password):
+        return None
+
+    if _needs_rehash(user["password"]):
+        try:
+            upgraded = _hash_password(password)
+        except PasswordHashingBusy:
+            return user  # upgrade on a quieter login
+        _write(lambda conn: conn.execute("UPDATE users SET password=? WHERE id=? AND password=?",
+                                         (upgraded, user["id"], user["password"])))
+    return user
 
 def get_user_by_username(username):
     conn = get_db_connection()
     user = conn.execute("SELECT * FROM users WHERE username = ?", (username,)).fetchone()
-    conn.close()
     return user
 
 def get_user_by_id(user_id):
     conn = get_db_connection()
     user = conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
-    conn.close()
     if user is None:
         abort(404)
     return user
 
 # Catalog 
 def get_all_categories():
-    conn = get_db_connection()
-    cats = conn.execute("SELECT * FROM categories ORDER BY name ASC").fetchall()
-    conn.close()
-    return cats
+    def load():
+        conn = _catalog_connection()
+        return conn.execute("SELECT * FROM categories ORDER BY name ASC").fetchall()
+    return _cached(("categories",), load)
 
-def get_all_products(category_id=None, limit=None, order_by="created DESC"):
-    conn = get_db_connection()
-    query = """
-        SELECT products.*, categories.name AS category_name
+# Keyset pagination: a cursor is the (sort key, id) of a row, base64'd so
+# clients treat it as opaque. Listings sort by created, search by rank.
+def encode_cursor(row):
+    key = row["search_rank"] if "search_rank" in row.keys() else row["created"]
+    raw = json.dumps([key, row["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        key, row_id = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(key, (str, int, float)) or not isinstance(row_id, int):
+        return None
+    return key, row_id
+
+# Columns a caller may ask for instead of products.* (see `fields` below),
+# as exposed by the JSON API
+PRODUCT_FIELDS = {
+    "id": "products.id",
+    "name": "products.name",
+    "description": "products.description",
+    "price": "products.price",
+    "stock": "products.stock",
+    "image_url": "products.image_url",
+    "sku": "products.sku",
+    "created": "products.created",
+    "category_id": "products.category",
+    "category": "categories.name",
+}
+
+def _product_columns(fields):
+    # SELECT list for the requested PRODUCT_FIELDS; id and created are
+    # always included because cursors are built from them
+    if not fields:
+        return "products.*, categories.name AS category_name"
+    wanted = dict.fromkeys(("id", "created", *fields))
+    return ", ".join(f"{PRODUCT_FIELDS[f]} AS {f}" for f in wanted)
+
+def get_all_products(category_id=None, limit=None, order_by=None, after=None, before=None,
+                     fields=None, price_band=None, in_stock=False):
+    # Newest first. `after` / `before` take a cursor from encode_cursor and
+    # return the page following / preceding that row (still newest first).
+    # `fields` selects only those PRODUCT_FIELDS. `price_band` (an index
+    # into PRICE_BANDS) and `in_stock` narrow the listing like category_id.
+    # The first page of each unfiltered or per-category listing is served
+    # from catalog_cache.
+    if limit and not (order_by or after or before or fields or price_band is not None or in_stock):
+        return _cached(
+            ("products", category_id or None, limit),
+            lambda: _query_products(category_id, limit, None, None, None),
+        )
+    return _query_products(category_id, limit, order_by, after, before, fields,
+                           price_band, in_stock)
+
+def _query_products(category_id, limit, order_by, after, before, fields=None,
+                    price_band=None, in_stock=False):
+    conn = _catalog_connection()
+    query = f"""
+        SELECT {_product_columns(fields)}
         FROM products
         JOIN categories ON products.category = categories.id
     """
-    params = []
+    where, params = [], []
     if category_id:
-        query += " WHERE categories.id = ?"
+        where.append("products.category = ?")
         params.append(category_id)
+    if price_band is not None:
+        matching, scope, band_rows = _facet_share(category_id, price_band, in_stock)
+        if not matching:
+            return []
+        # Walking the category/catalog newest first reads about
+        # limit * scope / matching rows; idx_products_price reads the whole
+        # band and sorts the matches. Pick the cheaper one explicitly, SQLite
+        # has no way to know how the band and the other filters overlap.
+        price = "+products.price"  # + keeps SQLite off the price index
+        if not limit or band_rows * matching < limit * scope:
+            query = query.replace("FROM products", "FROM products INDEXED BY idx_products_price", 1)
+            price = "products.price"
+        low, high = PRICE_BANDS[price_band]
+        where.append(f"{price} >= ?")
+        params.append(low)
+        if high is not None:
+            where.append(f"{price} < ?")
+            params.append(high)
+    if in_stock:
+        where.append("products.stock > 0")
 
-    query += f" ORDER BY {order_by}"
+    after, before = _decode_cursor(after), _decode_cursor(before)
+    if after:
+        where.append("(products.created, products.id) < (?, ?)")
+        params.extend(after)
+    elif before:
+        where.append("(products.created, products.id) > (?, ?)")
+        params.extend(before)
+    if where:
+        query += " WHERE " + " AND ".join(where)
+
+    if before:
+        query += " ORDER BY products.created ASC, products.id ASC"
+    elif order_by and not after:
+        query += f" ORDER BY {order_by}"
+    else:
+        query += " ORDER BY products.created DESC, products.id DESC"
     if limit:
         query += " LIMIT ?"
         params.append(limit)
 
     rows = conn.execute(query, tuple(params)).fetchall()
-    conn.close()
+    if before:
+        rows.reverse()
     return rows
 
-def search_products(keyword, limit=12):
+def _facet_share(category_id, price_band, in_stock):
+    # From product_facets: (products matching the filters, products in the
+    # category or catalog, products in the price band in any category).
+    # Read from the file: the catalog snapshot only copies SNAPSHOT_TABLES.
+    row = get_db_connection().execute("""
+        SELECT coalesce(SUM(CASE WHEN (?1 IS NULL OR category = ?1) AND band = ?2
+                                      AND (in_stock OR NOT ?3) THEN products END), 0),
+               coalesce(SUM(CASE WHEN ?1 IS NULL OR category = ?1 THEN products END), 0),
+               coalesce(SUM(CASE WHEN band = ?2 THEN products END), 0)
+        FROM product_facets
+    """, (category_id or None, price_band, bool(in_stock))).fetchone()
+    return tuple(row)
+
+def product_facet_counts(category_id=None, price_band=None, in_stock=False):
+    # Counts for the /products/ filters from product_facets (a few hundred
+    # rows, see db/migrate.py). Each facet is counted with the other
+    # filters applied but not its own, so every option shows how many
+    # products choosing it would list; "total" applies them all.
     conn = get_db_connection()
     rows = conn.execute(
+        "SELECT category, band, in_stock, products FROM product_facets WHERE products > 0"
+    ).fetchall()
+    categories, bands = {}, [0] * len(PRICE_BANDS)
+    stocked = total = 0
+    for category, band, row_in_stock, count in rows:
+        category_ok = not category_id or category == category_id
+        band_ok = price_band is None or band == price_band
+        stock_ok = not in_stock or row_in_stock
+        if band_ok and stock_ok:
+            categories[category] = categories.get(category, 0) + count
+        if category_ok and stock_ok:
+            bands[band] += count
+        if category_ok and band_ok:
+            stocked += count if row_in_stock else 0
+            if stock_ok:
+                total += count
+    return {"categories": categories, "price_bands": bands, "in_stock": stocked, "total": total}
+
+def _fts_query(keyword):
+    # "basmati ric" -> "basmati"* "ric"*  (every word, prefix match)
+    words = re.findall(r"\w+", keyword)
+    return " ".join(f'"{w}"*' for w in words)
+
+_fts_ready = None
+
+def _has_products_fts(conn):
+    global _fts_ready
+    if _fts_ready is None:
+        row = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='products_fts'"
+        ).fetchone()
+        _fts_ready = row is not None
+    return _fts_ready
+
+def search_products(keyword, limit=12, after=None, before=None, fields=None):
+    # Best match first (FTS5) or newest first (LIKE fallback); `after` /
+    # `before` page through the results and `fields` projects like
+    # get_all_products
+    global _fts_ready
+    conn = get_db_connection()
+    after, before = _decode_cursor(after), _decode_cursor(before)
+    columns = _product_columns(fields)
+    match = _fts_query(keyword)
+    if match and _has_products_fts(conn):
+        # rank is bm25 with the column weights set up in db/migrate.py
+        query = f"""
+            SELECT {columns}, products_fts.rank AS search_rank
+            FROM products_fts
+            JOIN products ON products.id = products_fts.rowid
+            JOIN categories ON products.category = categories.id
+            WHERE products_fts MATCH ?
         """
-        SELECT products.*, categories.name AS category_name
+        params = [match]
+        if after:
+            query += " AND (products_fts.rank, products.id) > (?, ?)"
+            params.extend(after)
+        elif before:
+            query += " AND (products_fts.rank, products.id) < (?, ?)"
+            params.extend(before)
+        if before:
+            query += " ORDER BY products_fts.rank DESC, products.id DESC LIMIT ?"
+        else:
+            query += " ORDER BY products_fts.rank ASC, products.id ASC LIMIT ?"
+        params.append(limit)
+        try:
+            rows = conn.execute(query, tuple(params)).fetchall()
+        except sqlite3.OperationalError:
+            # FTS5 missing from this SQLite build: use LIKE from now on
+            _fts_ready = False
+        else:
+            if before:
+                rows.reverse()
+            return rows
+
+    query = f"""
+        SELECT {columns}
         FROM products
         JOIN categories ON products.category = categories.id
         WHERE products.name LIKE ?
-        ORDER BY created DESC
-        LIMIT ?
-        """,
-        (f"%{keyword}%", limit)
-    ).fetchall()
-    conn.close()
+    """
+    params = [f"%{keyword}%"]
+    if after:
+        query += " AND (products.created, products.id) < (?, ?)"
+        params.extend(after)
+    elif before:
+        query += " AND (products.created, products.id) > (?, ?)"
+        params.extend(before)
+    if before:
+        query += " ORDER BY products.created ASC, products.id ASC LIMIT ?"
+    else:
+        query += " ORDER BY products.created DESC, products.id DESC LIMIT ?"
+    params.append(limit)
+
+    rows = conn.execute(query, tuple(params)).fetchall()
+    if before:
+        rows.reverse()
     return rows
 
-def get_product_by_id(product_id):
+def catalog_names(product_ids=None, category_ids=()):
+    # (kind, id, name) rows, kind "category" or "product", for the search
+    # suggestion index (suggest.py): the whole catalog, or only the given
+    # products and categories (ids that no longer exist are left out)
     conn = get_db_connection()
-    row = conn.execute("""
-        SELECT products.*, categories.name AS category_name
-        FROM products
-        JOIN categories ON products.category = categories.id
-        WHERE products.id = ?
-    """, (product_id,)).fetchone()
-    conn.close()
-    return row
+    if product_ids is None:
+        return conn.execute("""
+            SELECT 'category' AS kind, id, name FROM categories
+            UNION ALL
+            SELECT 'product', id, name FROM products
+        """).fetchall()
+    rows = []
+    for kind, table, ids in (("category", "categories", list(category_ids)),
+                             ("product", "products", list(product_ids))):
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            rows.extend(conn.execute(
+                f"SELECT ? AS kind, id, name FROM {table} WHERE id IN ({','.join('?' * len(chunk))})",
+                (kind, *chunk),
+            ).fetchall())
+    return rows
+
+def get_product_by_id(product_id):
+    def load():
+        conn = _catalog_connection()
+        return conn.execute("""
+            SELECT products.*, categories.name AS category_name
+            FROM products
+            JOIN categories ON products.category = categories.id
+            WHERE products.id = ?
+        """, (product_id,)).fetchone()
+    return _cached(("product", product_id), load)
 
 # Product CRUD  
 def create_product(user_id, category_id, name, description, price, image_url, stock):
     conn = get_db_connection()
-    conn.execute("""
-        INSERT INTO products (user, category, name, description, price, image_url, stock)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (user_id, category_id, name, description, price, image_url, stock))
+    # Reuse variants already generated for the same image, if any (no
+    # image: NULL matches nothing instead of every product without one)
+    cur = conn.execute("""
+        INSERT INTO products (user, category, name, description, price, image_url, stock,
+                              image_variants)
+        VALUES (?, ?, ?, ?, ?, ?, ?,
+                (SELECT image_variants FROM products
+                 WHERE image_url = ? AND image_variants IS NOT NULL LIMIT 1))
+    """, (user_id, category_id, name, description, price, image_url, stock, image_url or None))
     conn.commit()
-    conn.close()
+    catalog_snapshot.mark_stale()
+    _invalidate_products(cur.lastrowid, categories=(category_id,))
 
 def update_product(product_id, category_id, name, description, price, image_url, stock):
     conn = get_db_connection()
+    old = conn.execute("SELECT category FROM products WHERE id=?", (product_id,)).fetchone()
+    # Variants belong to the old image when image_url changes
     conn.execute("""
         UPDATE products
-        SET category=?, name=?, description=?, price=?, image_url=?, stock=?
+        SET category=?, name=?, description=?, price=?, image_url=?, stock=?,
+            image_variants = CASE WHEN image_url IS ? THEN image_variants END
         WHERE id=?
-    """, (category_id, name, description, price, image_url, stock, product_id))
+    """, (category_id, name, description, price, image_url, stock, image_url, product_id))
     conn.commit()
-    conn.close()
+    catalog_snapshot.mark_stale()
+    old_category = old["category"] if old else None
+    _invalidate_products(product_id, categories=(category_id, old_category))
 
 def delete_product(product_id):
+    # foreign_keys is ON: drop the product from carts first. Products that
+    # appear in orders raise sqlite3.IntegrityError and are kept.
+    conn = get_db_connection()
+    old = conn.execute("SELECT category FROM products WHERE id=?", (product_id,)).fetchone()
+    try:
+        conn.execute("DELETE FROM cart_items WHERE product_id=?", (product_id,))
+        conn.execute("DELETE FROM products WHERE id=?", (product_id,))
+        conn.commit()
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        raise
+    catalog_snapshot.mark_stale()
+    _invalidate_products(product_id, categories=(old["category"] if old else None,))
+
+def set_image_variants(image_url, variants):
+    # Called from the images.py workers once resized files exist
     conn = get_db_connection()
-    conn.execute("DELETE FROM products WHERE id=?", (product_id,))
+    rows = conn.execute(
+        "SELECT id, category FROM products WHERE image_url=?", (image_url,)
+    ).fetchall()
+    conn.execute("UPDATE products SET image_variants=? WHERE image_url=?", (variants, image_url))
     conn.commit()
-    conn.close()
+    catalog_snapshot.mark_stale()
+    _invalidate_products(*(row["id"] for row in rows),
+                         categories=[row["category"] for row in rows])
 
-# Cart helpers
+# Bulk import/export (catalog_io.py)
 
-def cart_add_item(user_id, product_id, qty=1):
+def resolve_categories(names, create_missing=False):
+    # {casefolded name: id} for every category, after creating the given
+    # names that do not exist yet when create_missing is set
     conn = get_db_connection()
+    known = {row["name"].casefold(): row["id"]
+             for row in conn.execute("SELECT id, name FROM categories")}
+    missing = sorted({n for n in names if n.casefold() not in known})
+    if create_missing and missing:
+        for name in missing:
+            cursor = conn.execute("INSERT INTO categories (name) VALUES (?)", (name,))
+            known[name.casefold()] = cursor.lastrowid
+        conn.commit()
+        catalog_cache.invalidate(lambda key: key[0] == "categories")
+    return known
 
-    # Insert new row, or if exists, increase quantity
-    conn.execute("""
-        INSERT INTO cart_items (user_id, product_id, quantity)
-        VALUES (?, ?, ?)
-        ON CONFLICT(user_id, product_id)
-        DO UPDATE SET quantity = quantity + excluded.quantity
-    """, (user_id, product_id, qty))
+# Rows match an existing product on id, then on sku; anything else is
+# inserted. Only the importing user's own products are updated, as with
+# the edit form. Columns left out of a row (None) keep their current value on
+# update. A new image_url drops the variants of the old one. Unchanged rows
+# are not rewritten, which also spares the products_fts update trigger.
+_UPSERT_PRODUCT = """
+    INSERT INTO products (id, sku, user, category, name, description, price, stock, image_url)
+    VALUES (:id, :sku, :user, :category, :name, COALESCE(:description, ''), :price,
+            COALESCE(:stock, 0), COALESCE(:image_url, ''))
+    ON CONFLICT(id) DO UPDATE SET {update}
+    ON CONFLICT(sku) WHERE sku IS NOT NULL DO UPDATE SET {update}
+""".format(update="""
+        sku = COALESCE(:sku, sku), category = :category, name = :name,
+        description = COALESCE(:description, description), price = :price,
+        stock = COALESCE(:stock, stock),
+        image_variants = CASE WHEN :image_url IS NULL OR image_url IS :image_url
+                              THEN image_variants END,
+        image_url = COALESCE(:image_url, image_url)
+      WHERE user = :user
+        AND (category IS NOT :category OR name IS NOT :name OR price IS NOT :price
+         OR (:sku IS NOT NULL AND sku IS NOT :sku)
+         OR (:description IS NOT NULL AND description IS NOT :description)
+         OR (:stock IS NOT NULL AND stock IS NOT :stock)
+         OR (:image_url IS NOT NULL AND image_url IS NOT :image_url))
+""")
 
+def _products_of_others(conn, user_id, rows):
+    # (ids, skus) among rows that belong to products of other users
+    found = conn.execute("""
+        SELECT id, sku FROM products
+        WHERE user IS NOT ?
+          AND (id IN (SELECT value FROM json_each(?)) OR sku IN (SELECT value FROM json_each(?)))
+    """, (user_id,
+          json.dumps([row["id"] for row in rows if row["id"] is not None]),
+          json.dumps([row["sku"] for row in rows if row["sku"] is not None]))).fetchall()
+    return {row["id"] for row in found}, {row["sku"] for row in found if row["sku"] is not None}
+
+def bulk_upsert_products(user_id, rows):
+    # rows: dicts with id, sku, category (id), name, description, price,
+    # stock, image_url. One executemany and one commit for the whole batch;
+    # if a row breaks a constraint the batch is replayed row by row so only
+    # that row is lost. Rows matching another user's product fail.
+    # Returns [(index in rows, error message)].
+    conn = get_db_connection()
+    other_ids, other_skus = _products_of_others(conn, user_id, rows)
+    params, indexes, failures = [], [], []
+    for index, row in enumerate(rows):
+        if row["id"] in other_ids or row["sku"] in other_skus:
+            failures.append((index, "product belongs to another user"))
+        else:
+            params.append(dict(row, user=user_id))
+            indexes.append(index)
+    try:
+        conn.executemany(_UPSERT_PRODUCT, params)
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        conn.execute("BEGIN")
+        for index, row in zip(indexes, params):
+            try:
+                conn.execute("SAVEPOINT product_row")
+                conn.execute(_UPSERT_PRODUCT, row)
+                conn.execute("RELEASE product_row")
+            except sqlite3.IntegrityError as e:
+                conn.execute("ROLLBACK TO product_row")
+                conn.execute("RELEASE product_row")
+                failures.append((index, str(e)))
     conn.commit()
-    conn.close()
+    catalog_snapshot.mark_stale()
+    _invalidate_catalog()
+    return sorted(failures)
+
+def export_products(batch_size=1000):
+    # Whole catalog in id order, read in keyset batches so a slow consumer
+    # never holds one long read transaction open
+    conn = get_db_connection()
+    last_id = 0
+    while True:
+        rows = conn.execute("""
+            SELECT products.id, products.sku, products.name, products.description,
+                   products.price, products.stock, categories.name AS category,
+                   products.image_url
+            FROM products
+            JOIN categories ON products.category = categories.id
+            WHERE products.id > ?
+            ORDER BY products.id
+            LIMIT ?
+        """, (last_id, batch_size)).fetchall()
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1]["id"]
+
+# Cart helpers
+
+def cart_add_item(user_id, product_id, qty=1):
+    def write(conn):
+        # Insert new row, or if exists, increase quantity
+        conn.execute("""
+            INSERT INTO cart_items (user_id, product_id, quantity)
+            VALUES (?, ?, ?)
+            ON CONFLICT(user_id, product_id)
+            DO UPDATE SET quantity = quantity + excluded.quantity
+        """, (user_id, product_id, qty))
+    _write(write)
 
 def cart_get_items(user_id):
     conn = get_db_connection()
@@ -170,66 +1152,193 @@ def cart_get_items(user_id):
         WHERE cart_items.user_id = ?
         ORDER BY products.name ASC
     """, (user_id,)).fetchall()
-    conn.close()
     return rows
 
 def cart_update_quantity(user_id, product_id, qty):
-    conn = get_db_connection()
-    if qty <= 0:
-        conn.execute("DELETE FROM cart_items WHERE user_id=? AND product_id=?", (user_id, product_id))
-    else:
-        conn.execute("""
-            UPDATE cart_items
-            SET quantity=?
-            WHERE user_id=? AND product_id=?
-        """, (qty, user_id, product_id))
-    conn.commit()
-    conn.close()
+    def write(conn):
+        if qty <= 0:
+            conn.execute("DELETE FROM cart_items WHERE user_id=? AND product_id=?",
+                         (user_id, product_id))
+        else:
+            conn.execute("""
+                UPDATE cart_items
+                SET quantity=?
+                WHERE user_id=? AND product_id=?
+            """, (qty, user_id, product_id))
+    _write(write)
+
+CART_OPS = ("add", "set", "remove")
+
+def cart_apply(user_id, operations):
+    # Applies [(op, product_id, qty)] in order in one transaction and
+    # returns the updated cart. "add" increases the quantity, "set"
+    # replaces it (0 removes the line), "remove" drops it. An unknown
+    # product raises sqlite3.IntegrityError and nothing is applied.
+    def write(conn):
+        for op, product_id, qty in operations:
+            if op == "add" and qty > 0:
+                conn.execute("""
+                    INSERT INTO cart_items (user_id, product_id, quantity)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(user_id, product_id)
+                    DO UPDATE SET quantity = quantity + excluded.quantity
+                """, (user_id, product_id, qty))
+            elif op == "set" and qty > 0:
+                conn.execute("""
+                    INSERT INTO cart_items (user_id, product_id, quantity)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(user_id, product_id)
+                    DO UPDATE SET quantity = excluded.quantity
+                """, (user_id, product_id, qty))
+            elif op in ("set", "remove"):
+                conn.execute("DELETE FROM cart_items WHERE user_id=? AND product_id=?",
+                             (user_id, product_id))
+    _write(write)
+    return cart_get_items(user_id)
 
 def cart_clear(user_id):
-    conn = get_db_connection()
-    conn.execute("DELETE FROM cart_items WHERE user_id=?", (user_id,))
-    conn.commit()
-    conn.close()
+    _write(lambda conn: conn.execute("DELETE FROM cart_items WHERE user_id=?", (user_id,)))
 
 
 # Orders helpers
 
+class OutOfStockError(Exception):
+    # Raised by order_create_from_cart; `items` are the cart lines asking
+    # for more than the remaining stock (product_id, name, stock, quantity)
+    def __init__(self, items):
+        super().__init__("Not enough stock for: " + ", ".join(row["name"] for row in items))
+        self.items = items
+
 def order_create_from_cart(user_id):
-    items = cart_get_items(user_id)
-    if not items:
-        return None  # nothing to checkout
+    # Checkout is one BEGIN IMMEDIATE transaction (or one savepoint in the
+    # writer's): the write lock is taken up front, so the stock check,
+    # order, order lines, stock decrement and cart clear cannot interleave
+    # with another checkout.
+    def write(conn):
+        lines = conn.execute("""
+            SELECT cart_items.product_id, cart_items.quantity,
+                   products.name, coalesce(products.stock, 0) AS stock,
+                   products.category
+            FROM cart_items
+            JOIN products ON cart_items.product_id = products.id
+            WHERE cart_items.user_id = ?
+        """, (user_id,)).fetchall()
+        if not lines:
+            return None, ()  # nothing to checkout
 
-    total = sum(row["price"] * row["quantity"] for row in items)
+        short = [row for row in lines if row["quantity"] > row["stock"]]
+        if short:
+            raise OutOfStockError(short)
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    # Create order
-    cur.execute("""
-        INSERT INTO orders (user_id, total, status)
-        VALUES (?, ?, ?)
-    """, (user_id, total, "placed"))
-    order_id = cur.lastrowid
-
-    # Add order lines
-    for row in items:
-        cur.execute("""
-            INSERT INTO order_items (order_id, product_id, quantity, price_each)
-            VALUES (?, ?, ?, ?)
-        """, (order_id, row["product_id"], row["quantity"], row["price"]))
+        cur = conn.execute("""
+            INSERT INTO orders (user_id, total, status)
+            SELECT ?, SUM(products.price * cart_items.quantity), 'placed'
+            FROM cart_items
+            JOIN products ON cart_items.product_id = products.id
+            WHERE cart_items.user_id = ?
+        """, (user_id, user_id))
+        order_id = cur.lastrowid
 
-    conn.commit()
-    conn.close()
+        conn.execute("""
+            INSERT INTO order_items (order_id, product_id, quantity, price_each, category_id)
+            SELECT ?, cart_items.product_id, cart_items.quantity, products.price,
+                   products.category
+            FROM cart_items
+            JOIN products ON cart_items.product_id = products.id
+            WHERE cart_items.user_id = ?
+        """, (order_id, user_id))
+
+        conn.executemany(
+            "UPDATE products SET stock = stock - ? WHERE id = ? AND stock >= ?",
+            [(row["quantity"], row["product_id"], row["quantity"]) for row in lines],
+        )
 
-    # Clear cart after successful order
-    cart_clear(user_id)
+        _record_sales(conn, order_id)
+        _record_pairs(conn, order_id)
+
+        conn.execute("DELETE FROM cart_items WHERE user_id=?", (user_id,))
+        return order_id, lines
+
+    order_id, lines = _write(write, immediate=True)
+    # Product pages and listings (in_stock filter) show stock
+    if lines:
+        _invalidate_products(*(row["product_id"] for row in lines),
+                             categories=tuple({row["category"] for row in lines}),
+                             stock_only=True)
     return order_id
 
+def _record_sales(conn, order_id):
+    # Adds one order to the daily sales rollups (tables and full rebuild in
+    # db/migrate.py), inside the checkout transaction
+    conn.execute("""
+        INSERT INTO sales_daily (day, orders, units, revenue)
+        SELECT date(orders.created), 1,
+               SUM(order_items.quantity), SUM(order_items.quantity * order_items.price_each)
+        FROM order_items
+        JOIN orders ON orders.id = order_items.order_id
+        WHERE order_items.order_id = ?
+        GROUP BY orders.id
+        ON CONFLICT (day) DO UPDATE SET
+            orders = orders + excluded.orders,
+            units = units + excluded.units,
+            revenue = revenue + excluded.revenue
+    """, (order_id,))
+    conn.execute("""
+        INSERT INTO sales_daily_product (day, product_id, orders, units, revenue)
+        SELECT date(orders.created), order_items.product_id, 1,
+               SUM(order_items.quantity), SUM(order_items.quantity * order_items.price_each)
+        FROM order_items
+        JOIN orders ON orders.id = order_items.order_id
+        WHERE order_items.order_id = ?
+        GROUP BY order_items.product_id
+        ON CONFLICT (day, product_id) DO UPDATE SET
+            orders = orders + excluded.orders,
+            units = units + excluded.units,
+            revenue = revenue + excluded.revenue
+    """, (order_id,))
+    conn.execute(f"""
+        INSERT INTO sales_daily_category (day, category_id, orders, units, revenue)
+        SELECT date(orders.created), {ORDER_LINE_CATEGORY}, 1,
+               SUM(order_items.quantity), SUM(order_items.quantity * order_items.price_each)
+        FROM order_items
+        JOIN orders ON orders.id = order_items.order_id
+        JOIN products ON products.id = order_items.product_id
+        WHERE order_items.order_id = ?
+        GROUP BY 2
+        ON CONFLICT (day, category_id) DO UPDATE SET
+            orders = orders + excluded.orders,
+            units = units + excluded.units,
+            revenue = revenue + excluded.revenue
+    """, (order_id,))
+
+def _record_pairs(conn, order_id):
+    # Counts the order once for every pair of its products, both directions
+    # (table and full rebuild in db/migrate.py)
+    conn.execute("""
+        INSERT INTO product_pairs (product_id, related_id, orders)
+        SELECT DISTINCT a.product_id, b.product_id, 1
+        FROM order_items a
+        JOIN order_items b ON b.order_id = a.order_id AND b.product_id != a.product_id
+        WHERE a.order_id = ?
+        ON CONFLICT (product_id, related_id) DO UPDATE SET orders = orders + 1
+    """, (order_id,))
+
+def related_products(product_id, limit=4):
+    # "Frequently bought together": in-stock products most often ordered
+    # with this one, from product_pairs (one index range scan)
+    conn = get_db_connection()
+    return conn.execute("""
+        SELECT products.*, product_pairs.orders AS together
+        FROM product_pairs
+        JOIN products ON products.id = product_pairs.related_id
+        WHERE product_pairs.product_id = ? AND products.stock > 0
+        ORDER BY product_pairs.orders DESC, product_pairs.related_id
+        LIMIT ?
+    """, (product_id, limit)).fetchall()
+
 def order_get(order_id):
     conn = get_db_connection()
     order = conn.execute("SELECT * FROM orders WHERE id=?", (order_id,)).fetchone()
-    conn.close()
     return order
 
 def order_get_items(order_id):
@@ -241,23 +1350,203 @@ def order_get_items(order_id):
         JOIN products ON order_items.product_id = products.id
         WHERE order_items.order_id = ?
     """, (order_id,)).fetchall()
-    conn.close()
     return rows
 
-def orders_for_user(user_id):
+def order_get_with_items(order_id):
+    # The order and its lines from one joined query: (order, items), or
+    # (None, []) if there is no such order
     conn = get_db_connection()
     rows = conn.execute("""
-        SELECT * FROM orders
-        WHERE user_id=?
-        ORDER BY created DESC
-    """, (user_id,)).fetchall()
-    conn.close()
-    return rows
+        SELECT orders.id, orders.user_id, orders.created, orders.status, orders.total,
+               order_items.product_id, order_items.quantity, order_items.price_each,
+               products.name
+        FROM orders
+        LEFT JOIN order_items ON order_items.order_id = orders.id
+        LEFT JOIN products ON order_items.product_id = products.id
+        WHERE orders.id = ?
+        ORDER BY order_items.id
+    """, (order_id,)).fetchall()
+    if not rows:
+        return None, []
+    return rows[0], [row for row in rows if row["product_id"] is not None]
+
+def orders_for_user(user_id, limit=None, after=None, before=None):
+    # Newest first, with item_count and units per order; keyset cursors on
+    # (created, id) as in get_all_products. The page is picked from the
+    # orders index first, so only its own lines are aggregated.
+    conn = get_db_connection()
+    where, params = ["user_id = ?"], [user_id]
+    after, before = _decode_cursor(after), _decode_cursor(before)
+    if after:
+        where.append("(created, id) < (?, ?)")
+        params.extend(after)
+    elif before:
+        where.append("(created, id) > (?, ?)")
+        params.extend(before)
+    direction = "ASC" if before else "DESC"
+    page_limit = ""
+    if limit:
+        page_limit = "LIMIT ?"
+        params.append(limit)
+
+    rows = conn.execute(f"""
+        WITH page AS (
+            SELECT * FROM orders
+            WHERE {" AND ".join(where)}
+            ORDER BY created {direction}, id {direction}
+            {page_limit}
+        )
+        SELECT page.*, COUNT(order_items.id) AS item_count,
+               COALESCE(SUM(order_items.quantity), 0) AS units
+        FROM page
+        LEFT JOIN order_items ON order_items.order_id = page.id
+        GROUP BY page.id
+        ORDER BY page.created {direction}, page.id {direction}
+    """, params).fetchall()
+    return rows[::-1] if before else rows
+
+def export_order_lines(user_id=None, start=None, end=None, batch_size=500):
+    # One row per order line, oldest first, optionally for one user and/or
+    # created in [start, end). Orders are read batch_size at a time by
+    # keyset on (created, id), so memory stays flat however many there are.
+    conn = get_db_connection()
+    where, params = [], []
+    if user_id is not None:
+        where.append("user_id = ?")
+        params.append(user_id)
+    if start:
+        where.append("created >= ?")
+        params.append(start)
+    if end:
+        where.append("created < ?")
+        params.append(end)
+    last = None
+    while True:
+        page_where, page_params = list(where), list(params)
+        if last:
+            page_where.append("(created, id) > (?, ?)")
+            page_params.extend(last)
+        rows = conn.execute(f"""
+            WITH page AS (
+                SELECT * FROM orders
+                {"WHERE " + " AND ".join(page_where) if page_where else ""}
+                ORDER BY created, id
+                LIMIT ?
+            )
+            SELECT page.id AS order_id, page.created, page.status, page.total,
+                   page.user_id, users.username,
+                   order_items.product_id, products.name AS product_name,
+                   order_items.quantity, order_items.price_each
+            FROM page
+            JOIN users ON users.id = page.user_id
+            LEFT JOIN order_items ON order_items.order_id = page.id
+            LEFT JOIN products ON order_items.product_id = products.id
+            ORDER BY page.created, page.id, order_items.id
+        """, page_params + [batch_size]).fetchall()
+        if not rows:
+            return
+        yield from rows
+        last = (rows[-1]["created"], rows[-1]["order_id"])
+
+# Sales dashboard: reads the daily rollups only, never order_items.
+# Days are 'YYYY-MM-DD' strings, both ends inclusive.
+
+def sales_by_day(start, end):
+    conn = get_db_connection()
+    return conn.execute("""
+        SELECT day, orders, units, revenue
+        FROM sales_daily
+        WHERE day BETWEEN ? AND ?
+        ORDER BY day
+    """, (start, end)).fetchall()
+
+def sales_by_category(start, end):
+    conn = get_db_connection()
+    return conn.execute("""
+        SELECT totals.*, categories.name
+        FROM (
+            SELECT category_id, SUM(orders) AS orders, SUM(units) AS units,
+                   SUM(revenue) AS revenue
+            FROM sales_daily_category
+            WHERE day BETWEEN ? AND ?
+            GROUP BY category_id
+        ) AS totals
+        LEFT JOIN categories ON categories.id = totals.category_id
+        ORDER BY totals.revenue DESC
+    """, (start, end)).fetchall()
+
+def top_products(start, end, limit=10):
+    conn = get_db_connection()
+    return conn.execute("""
+        SELECT totals.*, products.name
+        FROM (
+            SELECT product_id, SUM(orders) AS orders, SUM(units) AS units,
+                   SUM(revenue) AS revenue
+            FROM sales_daily_product
+            WHERE day BETWEEN ? AND ?
+            GROUP BY product_id
+            ORDER BY revenue DESC
+            LIMIT ?
+        ) AS totals
+        LEFT JOIN products ON products.id = totals.product_id
+        ORDER BY totals.revenue DESC
+    """, (start, end, limit)).fetchall()
 
 def is_user_admin(user_id):
     conn = get_db_connection()
     row = conn.execute("SELECT is_admin FROM users WHERE id=?", (user_id,)).fetchone()
-    conn.close()
     return bool(row and row["is_admin"] == 1)
 
 
+
+def set_user_admin(user_id, is_admin):
+    global _role_epoch
+    conn = get_db_connection()
+    conn.execute("UPDATE users SET is_admin=? WHERE id=?", (1 if is_admin else 0, user_id))
+    conn.commit()
+    _role_epoch = (0.0, None)  # this process sees the change immediately
+
+# Every write to products or categories bumps change_counters 'catalog'
+# and stamps when it happened (triggers in db/migrate.py), whichever
+# process made it. Returns (version, changed) with changed as
+# 'YYYY-MM-DD HH:MM:SS' UTC.
+def get_catalog_version():
+    conn = get_db_connection()
+    row = conn.execute(
+        "SELECT version, changed FROM change_counters WHERE name='catalog'"
+    ).fetchone()
+    return (row["version"], row["changed"]) if row else (0, None)
+
+def _change_versions(*names):
+    # Current version of each named change counter (0 if missing)
+    conn = get_db_connection()
+    versions = dict(conn.execute(
+        f"SELECT name, version FROM change_counters WHERE name IN ({','.join('?' * len(names))})",
+        names,
+    ).fetchall())
+    return tuple(versions.get(name, 0) for name in names)
+
+def get_catalog_last_changed():
+    # When products (stock included) or categories last changed
+    row = get_db_connection().execute(
+        "SELECT MAX(changed) FROM change_counters WHERE name IN ('catalog', 'stock')"
+    ).fetchone()
+    return row[0]
+
+# Role changes bump change_counters 'roles' (triggers in db/migrate.py).
+# Sessions remember the value their admin flag was checked against; the
+# counter itself is re-read at most every ROLE_EPOCH_TTL seconds per process,
+# which is also the longest a revoked admin keeps access in other workers.
+ROLE_EPOCH_TTL = 5.0
+_role_epoch = (0.0, None)  # (expires, version)
+
+def get_role_epoch():
+    global _role_epoch
+    expires, version = _role_epoch
+    now = time.monotonic()
+    if version is None or now >= expires:
+        conn = get_db_connection()
+        row = conn.execute("SELECT version FROM change_counters WHERE name='roles'").fetchone()
+        version = row["version"] if row else 0
+        _role_epoch = (now + ROLE_EPOCH_TTL, version)
+    return version
@@ -1,5 +1,6 @@
 import sqlite3
 from werkzeug.security import generate_password_hash
+from migrate import migrate
 
 # Creates db/database.db from db/schema.sql and inserts initial data
 connection = sqlite3.connect("database.db")
@@ -37,4 +38,7 @@ cur.executemany("""
 connection.commit()
 connection.close()
 
+# Indexes and later schema changes live in migrate.py
+migrate("database.db")
+
 print("Database created: db/database.db")
@@ -0,0 +1,614 @@
+import os
+import sqlite3
+import sys
+import time
+
+# Versioned schema migrations.
+#
+#   python -m db.migrate                 apply pending migrations
+#   python -m db.migrate --check-plans   EXPLAIN the db.py helpers
+#   python -m db.migrate --rebuild-rollups   recompute the sales rollups and
+#                                            product pairs
+#
+# Each migration runs once, inside its own transaction, and is recorded in
+# schema_version. Migrations are written to be idempotent so they can also
+# be applied to databases created from an older schema.sql.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.environ.get("STUDENTMART_DB", os.path.join(BASE_DIR, "database.db"))
+
+# /products/ price filter bands, lower bound inclusive and upper exclusive;
+# product_facets counts products per band. Changing them needs a new
+# migration that recreates the product_facets triggers and rebuilds it.
+PRICE_BANDS = ((0, 5), (5, 10), (10, 20), (20, 50), (50, 100), (100, None))
+
+
+def price_band_sql(price):
+    # SQL expression for the PRICE_BANDS index of `price`
+    cases = " ".join(f"WHEN {price} < {hi} THEN {i}"
+                     for i, (lo, hi) in enumerate(PRICE_BANDS) if hi is not None)
+    return f"CASE {cases} ELSE {len(PRICE_BANDS) - 1} END"
+
+
+def _column_names(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table});")]
+
+
+# ---------- Migrations ----------
+
+def _add_users_is_admin(conn):
+    # Was db/migrate_admin.py
+    if "is_admin" not in _column_names(conn, "users"):
+        conn.execute("ALTER TABLE users ADD COLUMN is_admin INTEGER NOT NULL DEFAULT 0;")
+
+def _add_cart_and_orders(conn):
+    # Was db/migrate_cart_orders.py
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS cart_items (
+          id INTEGER PRIMARY KEY AUTOINCREMENT,
+          user_id INTEGER NOT NULL REFERENCES users(id),
+          product_id INTEGER NOT NULL REFERENCES products(id),
+          quantity INTEGER NOT NULL DEFAULT 1,
+          UNIQUE(user_id, product_id)
+        );
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS orders (
+          id INTEGER PRIMARY KEY AUTOINCREMENT,
+          user_id INTEGER NOT NULL REFERENCES users(id),
+          created TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+          status TEXT NOT NULL DEFAULT 'placed',
+          total REAL NOT NULL DEFAULT 0
+        );
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS order_items (
+          id INTEGER PRIMARY KEY AUTOINCREMENT,
+          order_id INTEGER NOT NULL REFERENCES orders(id),
+          product_id INTEGER NOT NULL REFERENCES products(id),
+          quantity INTEGER NOT NULL DEFAULT 1,
+          price_each REAL NOT NULL
+        );
+    """)
+
+def _add_hot_query_indexes(conn):
+    # Listing by category / newest first, order history, receipts, and the
+    # child-side lookups foreign_keys=ON performs when a product is deleted.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_products_category_created ON products(category, created);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_products_created ON products(created);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_user_created ON orders(user_id, created);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_id);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_order_items_product ON order_items(product_id);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cart_items_product ON cart_items(product_id);")
+
+def fts5_available(conn):
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x);")
+    except sqlite3.OperationalError:
+        return False
+    conn.execute("DROP TABLE temp._fts5_probe;")
+    return True
+
+def _add_products_fts(conn):
+    # Full-text index over product name, description and category name,
+    # keyed by products.id and kept in sync by triggers. Skipped when this
+    # SQLite build has no FTS5; search_products then falls back to LIKE.
+    if not fts5_available(conn):
+        return
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+          name, description, category_name,
+          tokenize = 'unicode61 remove_diacritics 2',
+          prefix = '2 3'
+        );
+    """)
+    # Default ranking: bm25 weighted name > category name > description
+    conn.execute("""
+        INSERT INTO products_fts (products_fts, rank)
+        VALUES ('rank', 'bm25(10.0, 1.0, 3.0)');
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+          INSERT INTO products_fts (rowid, name, description, category_name)
+          VALUES (new.id, new.name, coalesce(new.description, ''),
+                  (SELECT name FROM categories WHERE id = new.category));
+        END;
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+          DELETE FROM products_fts WHERE rowid = old.id;
+        END;
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS products_fts_au
+        AFTER UPDATE OF name, description, category ON products BEGIN
+          UPDATE products_fts
+          SET name = new.name,
+              description = coalesce(new.description, ''),
+              category_name = (SELECT name FROM categories WHERE id = new.category)
+          WHERE rowid = old.id;
+        END;
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS categories_fts_au AFTER UPDATE OF name ON categories BEGIN
+          UPDATE products_fts SET category_name = new.name
+          WHERE rowid IN (SELECT id FROM products WHERE category = new.id);
+        END;
+    """)
+    conn.execute("DELETE FROM products_fts;")
+    conn.execute("""
+        INSERT INTO products_fts (rowid, name, description, category_name)
+        SELECT products.id, products.name, coalesce(products.description, ''), categories.name
+        FROM products
+        LEFT JOIN categories ON products.category = categories.id;
+    """)
+
+def _add_role_change_counter(conn):
+    # change_counters holds named version numbers that bump on writes, so
+    # processes can notice changes without re-reading the data itself.
+    # 'roles' bumps whenever a user's admin flag changes or a user goes away.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS change_counters (
+          name TEXT PRIMARY KEY,
+          version INTEGER NOT NULL DEFAULT 0
+        );
+    """)
+    conn.execute("INSERT OR IGNORE INTO change_counters (name, version) VALUES ('roles', 0);")
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS users_roles_au AFTER UPDATE OF is_admin ON users
+        WHEN old.is_admin IS NOT new.is_admin BEGIN
+          UPDATE change_counters SET version = version + 1 WHERE name = 'roles';
+        END;
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS users_roles_ad AFTER DELETE ON users BEGIN
+          UPDATE change_counters SET version = version + 1 WHERE name = 'roles';
+        END;
+    """)
+
+def _add_products_image_variants(conn):
+    # JSON written by images.py: original size plus resized/WebP variants
+    if "image_variants" not in _column_names(conn, "products"):
+        conn.execute("ALTER TABLE products ADD COLUMN image_variants TEXT;")
+
+def _add_products_sku(conn):
+    # Supplier reference; bulk imports upsert on it (catalog_io.py)
+    if "sku" not in _column_names(conn, "products"):
+        conn.execute("ALTER TABLE products ADD COLUMN sku TEXT;")
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_products_sku
+        ON products(sku) WHERE sku IS NOT NULL;
+    """)
+    # create_product / set_image_variants look products up by image_url
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_products_image_url ON products(image_url);")
+
+def _add_orders_created_index(conn):
+    # Admin order exports by date range across all users
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_created ON orders(created);")
+
+# The category an order line sold under: the one stored at checkout
+# (migration 13), or the product's current one for lines written without it
+ORDER_LINE_CATEGORY = "coalesce(order_items.category_id, products.category)"
+
+def rebuild_sales_rollups(conn):
+    # Recomputes the daily sales rollups from orders/order_items; checkout
+    # keeps them current afterwards (db.db.order_create_from_cart)
+    conn.execute("DELETE FROM sales_daily;")
+    conn.execute("DELETE FROM sales_daily_product;")
+    conn.execute("DELETE FROM sales_daily_category;")
+    # Migration 9 rebuilds before migration 13 adds order_items.category_id
+    category = ORDER_LINE_CATEGORY
+    if "category_id" not in _column_names(conn, "order_items"):
+        category = "products.category"
+    conn.execute("""
+        INSERT INTO sales_daily (day, orders, units, revenue)
+        SELECT date(orders.created), COUNT(DISTINCT orders.id), SUM(order_items.quantity),
+               SUM(order_items.quantity * order_items.price_each)
+        FROM order_items
+        JOIN orders ON orders.id = order_items.order_id
+        GROUP BY date(orders.created);
+    """)
+    conn.execute("""
+        INSERT INTO sales_daily_product (day, product_id, orders, units, revenue)
+        SELECT date(orders.created), order_items.product_id,
+               COUNT(DISTINCT orders.id), SUM(order_items.quantity),
+               SUM(order_items.quantity * order_items.price_each)
+        FROM order_items
+        JOIN orders ON orders.id = order_items.order_id
+        GROUP BY date(orders.created), order_items.product_id;
+    """)
+    conn.execute(f"""
+        INSERT INTO sales_daily_category (day, category_id, orders, units, revenue)
+        SELECT date(orders.created), {category},
+               COUNT(DISTINCT orders.id), SUM(order_items.quantity),
+               SUM(order_items.quantity * order_items.price_each)
+        FROM order_items
+        JOIN orders ON orders.id = order_items.order_id
+        JOIN products ON products.id = order_items.product_id
+        GROUP BY 1, 2;
+    """)
+
+def _add_sales_rollups(conn):
+    # Daily orders/units/revenue in total, per product and per category for
+    # the admin dashboard. day is date(orders.created); a product's sales
+    # count towards the category it had when the order was placed
+    # (order_items.category_id, migration 13).
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sales_daily (
+          day TEXT PRIMARY KEY,
+          orders INTEGER NOT NULL DEFAULT 0,
+          units INTEGER NOT NULL DEFAULT 0,
+          revenue REAL NOT NULL DEFAULT 0
+        ) WITHOUT ROWID;
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sales_daily_product (
+          day TEXT NOT NULL,
+          product_id INTEGER NOT NULL,
+          orders INTEGER NOT NULL DEFAULT 0,
+          units INTEGER NOT NULL DEFAULT 0,
+          revenue REAL NOT NULL DEFAULT 0,
+          PRIMARY KEY (day, product_id)
+        ) WITHOUT ROWID;
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sales_daily_category (
+          day TEXT NOT NULL,
+          category_id INTEGER NOT NULL,
+          orders INTEGER NOT NULL DEFAULT 0,
+          units INTEGER NOT NULL DEFAULT 0,
+          revenue REAL NOT NULL DEFAULT 0,
+          PRIMARY KEY (day, category_id)
+        ) WITHOUT ROWID;
+    """)
+    rebuild_sales_rollups(conn)
+
+def rebuild_product_pairs(conn):
+    # Recomputes "frequently bought together" from order_items; checkout
+    # adds each new order's pairs afterwards (db.db.order_create_from_cart)
+    conn.execute("DELETE FROM product_pairs;")
+    conn.execute("""
+        INSERT INTO product_pairs (product_id, related_id, orders)
+        SELECT a.product_id, b.product_id, COUNT(DISTINCT a.order_id)
+        FROM order_items a
+        JOIN order_items b ON b.order_id = a.order_id AND b.product_id != a.product_id
+        GROUP BY a.product_id, b.product_id;
+    """)
+
+def _add_product_pairs(conn):
+    # How many orders contained both products, stored in both directions.
+    # Every pair is kept, so incremental counts stay exact; the index
+    # serves a product's top-N related products in one range scan.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS product_pairs (
+          product_id INTEGER NOT NULL,
+          related_id INTEGER NOT NULL,
+          orders INTEGER NOT NULL DEFAULT 0,
+          PRIMARY KEY (product_id, related_id)
+        ) WITHOUT ROWID;
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_product_pairs_top
+        ON product_pairs(product_id, orders DESC, related_id);
+    """)
+    rebuild_product_pairs(conn)
+
+def rebuild_product_facets(conn):
+    # Recomputes product_facets from products; triggers keep it current
+    conn.execute("DELETE FROM product_facets;")
+    conn.execute(f"""
+        INSERT INTO product_facets (category, band, in_stock, products)
+        SELECT category, {price_band_sql("price")}, coalesce(stock, 0) > 0, COUNT(*)
+        FROM products
+        GROUP BY 1, 2, 3;
+    """)
+
+def _add_product_facets(conn):
+    # Products per (category, price band, in stock) for the /products/
+    # filter counts: at most categories x bands x 2 rows, so every facet
+    # count is a sum over a few hundred rows instead of a scan of products.
+    # Checkout changes a cell only when a product sells out.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS product_facets (
+          category INTEGER NOT NULL,
+          band INTEGER NOT NULL,
+          in_stock INTEGER NOT NULL,
+          products INTEGER NOT NULL DEFAULT 0,
+          PRIMARY KEY (category, band, in_stock)
+        ) WITHOUT ROWID;
+    """)
+    old_cell = f"OLD.category, {price_band_sql('OLD.price')}, coalesce(OLD.stock, 0) > 0"
+    new_cell = f"NEW.category, {price_band_sql('NEW.price')}, coalesce(NEW.stock, 0) > 0"
+    add = """
+        INSERT INTO product_facets (category, band, in_stock, products)
+        VALUES ({cell}, {delta})
+        ON CONFLICT (category, band, in_stock) DO UPDATE SET products = products + {delta};
+    """
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS products_facets_insert AFTER INSERT ON products BEGIN
+          {add.format(cell=new_cell, delta=1)}
+        END;
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS products_facets_delete AFTER DELETE ON products BEGIN
+          {add.format(cell=old_cell, delta=-1)}
+        END;
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS products_facets_update
+        AFTER UPDATE OF category, price, stock ON products
+        WHEN ({old_cell}) IS NOT ({new_cell})
+        BEGIN
+          {add.format(cell=old_cell, delta=-1)}
+          {add.format(cell=new_cell, delta=1)}
+        END;
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_products_price ON products(price);")
+    rebuild_product_facets(conn)
+
+def _add_catalog_change_counter(conn):
+    # 'catalog' bumps on every write to products or categories (stock-only
+    # updates count separately since migration 14), and
+    # change_counters.changed records when (HTTP Last-Modified for the JSON
+    # API, cache refresh checks)
+    if "changed" not in _column_names(conn, "change_counters"):
+        conn.execute("ALTER TABLE change_counters ADD COLUMN changed TEXT;")
+    conn.execute("""
+        INSERT OR IGNORE INTO change_counters (name, version, changed)
+        VALUES ('catalog', 0, CURRENT_TIMESTAMP);
+    """)
+    for table in ("products", "categories"):
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_catalog_{event.lower()}
+                AFTER {event} ON {table} BEGIN
+                  UPDATE change_counters
+                  SET version = version + 1, changed = CURRENT_TIMESTAMP
+                  WHERE name = 'catalog';
+                END;
+            """)
+
+def _add_order_items_category(conn):
+    # The product's category at checkout, so rebuild_sales_rollups counts
+    # sales where checkout did even after a product moves category. Lines
+    # from before this migration get the category products have now, the
+    # closest record there is.
+    if "category_id" not in _column_names(conn, "order_items"):
+        conn.execute("ALTER TABLE order_items ADD COLUMN category_id INTEGER;")
+    conn.execute("""
+        UPDATE order_items
+        SET category_id = (SELECT category FROM products WHERE products.id = order_items.product_id)
+        WHERE category_id IS NULL;
+    """)
+
+# Every products column but stock: checkout only decrements stock, which
+# must not make catalog caches and the in-memory snapshot reload everything
+CATALOG_PRODUCT_COLUMNS = ("id", "user", "category", "name", "description", "price", "image_url",
+                           "image_variants", "sku", "created")
+
+def _add_stock_change_counter(conn):
+    # 'catalog' no longer bumps on stock-only updates; 'stock' does, so the
+    # catalog snapshot can re-read just the stock column (db.db.CatalogSnapshot)
+    conn.execute("""
+        INSERT OR IGNORE INTO change_counters (name, version, changed)
+        VALUES ('stock', 0, CURRENT_TIMESTAMP);
+    """)
+    conn.execute("DROP TRIGGER IF EXISTS products_catalog_update;")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS products_catalog_update
+        AFTER UPDATE OF {", ".join(CATALOG_PRODUCT_COLUMNS)} ON products BEGIN
+          UPDATE change_counters
+          SET version = version + 1, changed = CURRENT_TIMESTAMP
+          WHERE name = 'catalog';
+        END;
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS products_stock_update
+        AFTER UPDATE OF stock ON products
+        WHEN OLD.stock IS NOT NEW.stock BEGIN
+          UPDATE change_counters
+          SET version = version + 1, changed = CURRENT_TIMESTAMP
+          WHERE name = 'stock';
+        END;
+    """)
+
+
+# (version, name, function) -- append only, never renumber
+MIGRATIONS = [
+    (1, "users.is_admin", _add_users_is_admin),
+    (2, "cart_items, orders, order_items", _add_cart_and_orders),
+    (3, "indexes for hot queries", _add_hot_query_indexes),
+    (4, "products_fts full-text index", _add_products_fts),
+    (5, "change_counters, roles counter", _add_role_change_counter),
+    (6, "products.image_variants", _add_products_image_variants),
+    (7, "products.sku, image_url index", _add_products_sku),
+    (8, "orders(created) index", _add_orders_created_index),
+    (9, "daily sales rollups", _add_sales_rollups),
+    (10, "catalog change counter", _add_catalog_change_counter),
+    (11, "product_pairs (bought together)", _add_product_pairs),
+    (12, "product_facets, price index", _add_product_facets),
+    (13, "order_items.category_id", _add_order_items_category),
+    (14, "stock change counter", _add_stock_change_counter),
+]
+
+
+def current_version(conn):
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+def migrate(db_path=DB_PATH, verbose=False):
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+              version INTEGER PRIMARY KEY,
+              name TEXT NOT NULL,
+              applied TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        for version, name, apply in MIGRATIONS:
+            # Take the write lock before re-checking so concurrent workers
+            # starting up cannot apply the same migration twice
+            conn.execute("BEGIN IMMEDIATE;")
+            try:
+                done = conn.execute(
+                    "SELECT 1 FROM schema_version WHERE version=?", (version,)
+                ).fetchone()
+                if not done:
+                    apply(conn)
+                    conn.execute(
+                        "INSERT INTO schema_version (version, name) VALUES (?, ?)",
+                        (version, name),
+                    )
+                conn.execute("COMMIT;")
+            except Exception:
+                conn.execute("ROLLBACK;")
+                raise
+            if verbose and not done:
+                print(f"Applied migration {version}: {name}")
+        if verbose:
+            print(f"Schema is at version {current_version(conn)}")
+    finally:
+        conn.close()
+
+
+# ---------- Query plan check ----------
+
+# Helpers that are expected to read a whole table
+FULL_SCAN_OK = {
+    "get_all_categories",                  # returns every category by design
+    "search_products",                     # LIKE fallback when FTS5 is missing
+}
+
+# Tables small enough to read whole: product_facets has at most
+# categories x PRICE_BANDS x 2 rows
+SMALL_TABLES = {"product_facets"}
+
+def _plan_samples(conn):
+    # One representative call per read helper, using ids from the database
+    def first(sql):
+        row = conn.execute(sql).fetchone()
+        return row[0] if row else 1
+
+    user_id = first("SELECT id FROM users ORDER BY id LIMIT 1")
+    category_id = first("SELECT id FROM categories ORDER BY id LIMIT 1")
+    product_id = first("SELECT id FROM products ORDER BY id LIMIT 1")
+    order_id = first("SELECT id FROM orders ORDER BY id LIMIT 1")
+    username = first("SELECT username FROM users ORDER BY id LIMIT 1")
+
+    return [
+        ("get_user_by_username", (username,)),
+        ("get_user_by_id", (user_id,)),
+        ("is_user_admin", (user_id,)),
+        ("get_all_categories", ()),
+        ("get_all_products", ()),
+        ("get_all_products", (category_id,)),
+        ("get_all_products", (None, 12)),
+        ("get_all_products", (category_id, 12, None, None, None, None, 0, True)),
+        ("get_all_products", (None, 12, None, None, None, None, len(PRICE_BANDS) - 1)),
+        ("product_facet_counts", (category_id, 1, True)),
+        ("get_product_by_id", (product_id,)),
+        ("search_products", ("rice",)),
+        ("cart_get_items", (user_id,)),
+        ("order_get", (order_id,)),
+        ("order_get_items", (order_id,)),
+        ("orders_for_user", (user_id,)),
+        ("orders_for_user", (user_id, 13)),
+        ("order_get_with_items", (order_id,)),
+        ("sales_by_day", ("2025-01-01", "2025-01-31")),
+        ("sales_by_category", ("2025-01-01", "2025-01-31")),
+        ("top_products", ("2025-01-01", "2025-01-31")),
+        ("related_products", (product_id,)),
+    ]
+
+def _is_helper_statement(sql):
+    # The trace callback also reports statements SQLite runs on its own:
+    # nested ones ("-- ..."), FTS5 shadow-table reads, pragmas and the
+    # one-off sqlite_master lookup in db.py
+    sql = sql.lstrip()
+    return not (
+        sql.startswith("--")
+        or sql.upper().startswith("PRAGMA")
+        or "'main'." in sql
+        or "sqlite_master" in sql
+    )
+
+def full_scans(plan):
+    # Lines of an EXPLAIN QUERY PLAN that read a whole table without an
+    # index. Scans of a CTE or subquery result (already bounded by the
+    # plan that built it) and of SMALL_TABLES do not count.
+    derived = {line.split()[1] for line in plan
+               if line.startswith(("CO-ROUTINE ", "MATERIALIZE "))}
+    return [
+        line for line in plan
+        if line.startswith("SCAN") and "INDEX" not in line
+        and line.split()[1] not in derived | SMALL_TABLES
+    ]
+
+def check_query_plans(verbose=True):
+    # Runs each read helper in db/db.py with tracing on, EXPLAINs every
+    # statement it issued and reports full-table SCANs. Returns the list of
+    # offending helpers (empty when every helper is served by an index).
+    from db import db as helpers
+
+    helpers.catalog_cache.enabled = False  # every call must reach SQLite
+    conn = helpers.get_db_connection()
+    statements = []
+    conn.set_trace_callback(statements.append)
+    failures = []
+    try:
+        for name, args in _plan_samples(conn):
+            statements.clear()
+            getattr(helpers, name)(*args)
+            for sql in filter(_is_helper_statement, list(statements)):
+                plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+                bad = bool(full_scans(plan)) and name not in FULL_SCAN_OK
+                if bad:
+                    failures.append(name)
+                if verbose:
+                    status = "FAIL" if bad else "ok"
+                    print(f"[{status}] {name}{args}")
+                    for line in plan:
+                        print(f"         {line}")
+    finally:
+        conn.set_trace_callback(None)
+        helpers.close_db_connection()
+    return failures
+
+
+def rebuild_rollups(db_path=DB_PATH, verbose=True):
+    # Offline backfill of the tables checkout maintains incrementally
+    # (sales rollups, product pairs)
+    started = time.perf_counter()
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute("BEGIN IMMEDIATE;")
+        try:
+            rebuild_sales_rollups(conn)
+            rebuild_product_pairs(conn)
+            conn.execute("COMMIT;")
+        except Exception:
+            conn.execute("ROLLBACK;")
+            raise
+        if verbose:
+            for table in ("sales_daily", "sales_daily_product", "sales_daily_category",
+                          "product_pairs"):
+                count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                print(f"{table}: {count} rows")
+            print(f"Rebuilt in {time.perf_counter() - started:.1f}s")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    if "--rebuild-rollups" in sys.argv[1:]:
+        migrate()
+        rebuild_rollups()
+    elif "--check-plans" in sys.argv[1:]:
+        failed = check_query_plans()
+        if failed:
+            print(f"Full table scans in: {', '.join(sorted(set(failed)))}")
+            sys.exit(1)
+        print("All helpers use an index.")
+    else:
+        migrate(verbose=True)
@@ -1,6 +1,7 @@
 DROP TABLE IF EXISTS users;
 DROP TABLE IF EXISTS categories;
 DROP TABLE IF EXISTS products;
+DROP TABLE IF EXISTS schema_version;
 
 CREATE TABLE users (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
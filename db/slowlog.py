@@ -0,0 +1,180 @@
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+from db import db
+from db.migrate import full_scans
+
+# Slow-query log.
+#
+#   python -m db.slowlog [--log PATH] [--top N]   summarize the worst offenders
+#
+# Once enable_slow_query_log() has run, every statement that takes longer
+# than STUDENTMART_SLOW_QUERY_MS (default 0: off, e.g. 100) is written as one JSON line to a rotating log file. Each entry holds the
+# normalized SQL, the parameter types, the duration, the db.py helper that
+# issued it, that helper's caller, and the EXPLAIN QUERY PLAN of that exact
+# statement with full-table SCANs flagged. The plan comes from the real call
+# because helpers such as get_all_products build their SQL per call.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SLOW_QUERY_MS = float(os.environ.get("STUDENTMART_SLOW_QUERY_MS", "0"))
+SLOW_QUERY_LOG = os.environ.get("STUDENTMART_SLOW_QUERY_LOG",
+                                os.path.join(BASE_DIR, "slow_queries.log"))
+MAX_BYTES = 1_000_000
+BACKUP_COUNT = 5
+
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+_logger = logging.getLogger("studentmart.slow_queries")
+_threshold = None  # seconds, once enabled
+_explain_local = threading.local()
+
+_SPACE = re.compile(r"\s+")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?){2,}\s*\)")
+
+
+def normalize(sql):
+    # Literals become ?, long IN (...) lists collapse, whitespace is squeezed
+    sql = _SPACE.sub(" ", sql).strip()
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    return _IN_LIST.sub("(?, ...)", sql)
+
+
+def params_shape(params):
+    # Types only; values may be passwords or other user data
+    if params is None:
+        return "executemany"
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in params.items()}
+    return [type(value).__name__ for value in params]
+
+
+def _callers():
+    # (outermost db.py function, first frame outside db.py above it)
+    helper = caller = None
+    frame = sys._getframe(2)
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename == db.__file__:
+            helper = code.co_name
+        elif helper is not None:
+            caller = f"{os.path.basename(code.co_filename)}:{frame.f_lineno} {code.co_name}"
+            break
+        frame = frame.f_back
+    return helper, caller
+
+
+def _explain(sql, params):
+    if params is None or not sql.lstrip().upper().startswith(EXPLAINABLE):
+        return []
+    # A separate plain connection: only the schema is needed, and queries
+    # on it are not instrumented
+    conn = getattr(_explain_local, "conn", None)
+    if conn is None:
+        conn = _explain_local.conn = sqlite3.connect(db.DB_PATH)
+    try:
+        return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+    except sqlite3.Error as e:
+        return [f"(not explained: {e})"]
+
+
+def _check(sql, params, seconds):
+    if seconds < _threshold:
+        return
+    helper, caller = _callers()
+    plan = _explain(sql, params)
+    _logger.warning(json.dumps({
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "ms": round(seconds * 1000, 3),
+        "helper": helper,
+        "caller": caller,
+        "sql": normalize(sql),
+        "params": params_shape(params),
+        "plan": plan,
+        "scan": full_scans(plan),
+    }))
+
+
+def enable_slow_query_log(threshold_ms=SLOW_QUERY_MS, path=SLOW_QUERY_LOG):
+    # Returns True once the log is active; a threshold <= 0 leaves it off
+    global _threshold
+    if threshold_ms <= 0:
+        return False
+    if _threshold is None:
+        handler = RotatingFileHandler(path, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT,
+                                      encoding="utf-8", delay=True)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _logger.addHandler(handler)
+        _logger.setLevel(logging.WARNING)
+        _logger.propagate = False
+        db.on_query(_check)
+    _threshold = threshold_ms / 1000
+    return True
+
+
+# ---------- Summary ----------
+
+def read_entries(path=SLOW_QUERY_LOG):
+    # The current file plus rotated ones (path.1 ... path.N), oldest first
+    paths = [f"{path}.{n}" for n in range(BACKUP_COUNT, 0, -1)] + [path]
+    for p in paths:
+        if not os.path.exists(p):
+            continue
+        with open(p, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def summarize(entries):
+    # One row per normalized statement, worst total time first
+    groups = {}
+    for entry in entries:
+        group = groups.setdefault(entry["sql"], {
+            "sql": entry["sql"], "count": 0, "total_ms": 0.0, "max_ms": 0.0,
+            "helpers": set(), "plan": [], "scan": [],
+        })
+        group["count"] += 1
+        group["total_ms"] += entry["ms"]
+        group["helpers"].add(entry["helper"] or entry["caller"] or "?")
+        if entry["ms"] >= group["max_ms"]:
+            group["max_ms"] = entry["ms"]
+            group["plan"], group["scan"] = entry["plan"], entry["scan"]
+    return sorted(groups.values(), key=lambda g: g["total_ms"], reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize the slow-query log.")
+    parser.add_argument("--log", default=SLOW_QUERY_LOG)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    groups = summarize(read_entries(args.log))
+    if not groups:
+        print(f"No slow queries logged in {args.log}")
+        return
+    print(f"{'total ms':>10}{'count':>7}{'avg ms':>9}{'max ms':>9}  helper")
+    for group in groups[:args.top]:
+        flag = "  [FULL SCAN]" if group["scan"] else ""
+        print(f"{group['total_ms']:>10.1f}{group['count']:>7}"
+              f"{group['total_ms'] / group['count']:>9.1f}{group['max_ms']:>9.1f}"
+              f"  {', '.join(sorted(group['helpers']))}{flag}")
+        print(f"    {group['sql']}")
+        for line in group["plan"]:
+            print(f"      {line}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from assets import static_url
+
+# Resized thumbnail/detail variants (original format + WebP) for uploaded
+# product images. Generated off the request thread; the sizes end up as JSON
+# in products.image_variants, which templates turn into srcset attributes.
+# Needs Pillow -- without it uploads keep working and pages use originals.
+#
+#   python images.py      generate variants for every uploaded image
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional dependency
+    Image = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+UPLOAD_FOLDER = os.path.join(BASE_DIR, "static", "uploads")
+UPLOAD_URL = "/static/uploads/"
+DERIVED_FOLDER = os.path.join(UPLOAD_FOLDER, "derived")
+DERIVED_URL = UPLOAD_URL + "derived/"
+
+# Target widths per use; never upscaled
+WIDTHS = {
+    "thumb": (320, 640),     # product cards (1x / 2x)
+    "detail": (960,),        # product page
+}
+JPEG_QUALITY = 82
+WEBP_QUALITY = 78
+
+# Small pool: resizing is CPU-bound and must not starve request threads
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="images")
+
+
+def is_local_upload(image_url):
+    return bool(image_url) and image_url.startswith(UPLOAD_URL) and "/derived/" not in image_url
+
+
+def _fallback_format(img):
+    # WebP is always generated; the fallback keeps alpha as PNG
+    return "png" if img.mode in ("RGBA", "LA", "P") else "jpeg"
+
+
+def _save(img, path, fmt):
+    if fmt == "jpeg":
+        img.convert("RGB").save(path, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+    elif fmt == "webp":
+        img.save(path, "WEBP", quality=WEBP_QUALITY, method=4)
+    else:
+        img.save(path, "PNG", optimize=True)
+
+
+def generate_variants(image_url):
+    # Writes the variant files and returns the dict stored in
+    # products.image_variants, or None when nothing could be generated
+    if Image is None or not is_local_upload(image_url):
+        return None
+    filename = image_url[len(UPLOAD_URL):]
+    source = os.path.join(UPLOAD_FOLDER, filename)
+    if not os.path.isfile(source):
+        return None
+
+    os.makedirs(DERIVED_FOLDER, exist_ok=True)
+    with Image.open(source) as opened:
+        img = ImageOps.exif_transpose(opened)
+        img.load()
+    fallback = _fallback_format(img)
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if fallback == "png" else "RGB")
+
+    info = {"width": img.width, "height": img.height, "variants": {}}
+    for use, widths in WIDTHS.items():
+        entries = []
+        for width in sorted({min(w, img.width) for w in widths}):
+            height = round(img.height * width / img.width)
+            resized = img if width == img.width else img.resize((width, height), Image.LANCZOS)
+            for fmt in ("webp", fallback):
+                ext = "jpg" if fmt == "jpeg" else fmt
+                # Full source name: x.jpg and x.png must not share x-320.webp
+                name = f"{filename}-{width}.{ext}"
+                _save(resized, os.path.join(DERIVED_FOLDER, name), fmt)
+                entries.append({"url": DERIVED_URL + name, "width": width,
+                                "height": height, "type": f"image/{fmt}"})
+        info["variants"][use] = entries
+    return info
+
+
+def _generate_and_store(image_url):
+    from db.db import close_db_connection, set_image_variants
+
+    try:
+        info = generate_variants(image_url)
+        if info is not None:
+            set_image_variants(image_url, json.dumps(info, separators=(",", ":")))
+    except Exception as e:  # a bad upload must not kill the worker
+        print(f"images: could not process {image_url}: {e}", file=sys.stderr)
+    finally:
+        close_db_connection()
+
+
+def process_upload(image_url):
+    # Queue variant generation for a freshly saved upload
+    if Image is not None and is_local_upload(image_url):
+        return _executor.submit(_generate_and_store, image_url)
+    return None
+
+
+# ---------- Template helpers ----------
+
+def _variants(product, use):
+    raw = product["image_variants"] if "image_variants" in product.keys() else None
+    if not raw:
+        return None, []
+    info = json.loads(raw)
+    return info, info["variants"].get(use, [])
+
+
+def image_sources(product, use="thumb"):
+    # {"src", "srcset", "webp_srcset", "width", "height"} for <picture>/<img>,
+    # with fingerprinted URLs (assets.py); just image_url until variants exist
+    info, entries = _variants(product, use)
+    if not entries:
+        return {"src": static_url(product["image_url"]), "srcset": "", "webp_srcset": "",
+                "width": None, "height": None}
+
+    def srcset(types):
+        return ", ".join(f"{static_url(e['url'])} {e['width']}w"
+                         for e in entries if e["type"] in types)
+
+    fallback = [e for e in entries if e["type"] != "image/webp"]
+    return {
+        "src": static_url(fallback[0]["url"]),
+        "srcset": srcset({"image/jpeg", "image/png"}),
+        "webp_srcset": srcset({"image/webp"}),
+        "width": fallback[0]["width"],
+        "height": fallback[0]["height"],
+    }
+
+
+if __name__ == "__main__":
+    if Image is None:
+        sys.exit("Pillow is not installed: pip install pillow")
+    from db.db import get_db_connection
+
+    conn = get_db_connection()
+    urls = [row[0] for row in conn.execute(
+        "SELECT DISTINCT image_url FROM products WHERE image_url LIKE ?", (UPLOAD_URL + "%",)
+    )]
+    for url in urls:
+        _generate_and_store(url)
+        print(f"processed {url}")
+    print(f"{len(urls)} images")
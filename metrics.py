@@ -0,0 +1,162 @@
+import bisect
+import os
+import threading
+import time
+
+from flask import g, has_app_context, request
+
+from db.db import on_connection_open, on_query
+
+# Per-route request metrics in Prometheus text format: request latency,
+# SQL statements and SQL time per request, and connections opened. Queries
+# are timed by the hooks in db/db.py, which metrics installs only when
+# enabled; STUDENTMART_METRICS=0 leaves requests uninstrumented, and
+# connections too unless the slow-query log (db/slowlog.py,
+# STUDENTMART_SLOW_QUERY_MS) is on. Only queries made while handling a
+# request are counted (not image workers or scripts).
+
+ENABLED = os.environ.get("STUDENTMART_METRICS", "1") != "0"
+PREFIX = "studentmart_"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class RouteStats:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.query_seconds = 0.0
+        self.connections = 0
+        self.connect_seconds = 0.0
+        self.responses = {}  # (method, status) -> count
+
+
+_routes = {}
+_lock = threading.Lock()
+
+
+# ---------- Collection ----------
+
+def _count_query(sql, params, seconds):
+    stats = g.get("request_metrics") if has_app_context() else None
+    if stats is not None:
+        stats[1] += 1
+        stats[2] += seconds
+
+
+def _count_connection(seconds):
+    stats = g.get("request_metrics") if has_app_context() else None
+    if stats is not None:
+        stats[3] += 1
+        stats[4] += seconds
+
+
+if ENABLED:
+    on_query(_count_query)
+    on_connection_open(_count_connection)
+
+
+def start_request():
+    # [started, queries, query seconds, connections, connect seconds]
+    g.request_metrics = [time.perf_counter(), 0, 0.0, 0, 0.0]
+
+
+def finish_request(response):
+    stats = g.pop("request_metrics", None)
+    if stats is None:
+        return response
+    elapsed = time.perf_counter() - stats[0]
+    route = request.endpoint or "unmatched"
+    key = (request.method, str(response.status_code))
+    with _lock:
+        route_stats = _routes.get(route)
+        if route_stats is None:
+            route_stats = _routes[route] = RouteStats()
+        route_stats.latency.observe(elapsed)
+        route_stats.queries.observe(stats[1])
+        route_stats.query_seconds += stats[2]
+        route_stats.connections += stats[3]
+        route_stats.connect_seconds += stats[4]
+        route_stats.responses[key] = route_stats.responses.get(key, 0) + 1
+    return response
+
+
+# ---------- Prometheus text format ----------
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _bound(value):
+    return "+Inf" if value is None else repr(float(value))
+
+
+def render(caches=None):
+    # caches: {"name": CatalogCache} whose hit/miss counters are exported too
+    out = []
+
+    def metric(name, kind, help_text, samples):
+        out.append(f"# HELP {PREFIX}{name} {help_text}")
+        out.append(f"# TYPE {PREFIX}{name} {kind}")
+        for suffix, labels, value in samples:
+            out.append(f"{PREFIX}{name}{suffix}{_labels(**labels)} {value}")
+
+    def histogram(route, hist):
+        samples, cumulative = [], 0
+        for bound, count in zip(list(hist.buckets) + [None], hist.counts):
+            cumulative += count
+            samples.append(("_bucket", {"route": route, "le": _bound(bound)}, cumulative))
+        samples.append(("_sum", {"route": route}, repr(hist.sum)))
+        samples.append(("_count", {"route": route}, cumulative))
+        return samples
+
+    with _lock:
+        routes = sorted(_routes.items())
+        metric("http_requests_total", "counter", "Requests handled, by route, method and status.", [
+            ("", {"route": route, "method": method, "status": status}, count)
+            for route, stats in routes
+            for (method, status), count in sorted(stats.responses.items())
+        ])
+        metric("http_request_duration_seconds", "histogram", "Request latency by route.", [
+            sample for route, stats in routes for sample in histogram(route, stats.latency)
+        ])
+        metric("db_queries_per_request", "histogram", "SQL statements run per request, by route.", [
+            sample for route, stats in routes for sample in histogram(route, stats.queries)
+        ])
+        metric("db_query_seconds_total", "counter", "Time spent in SQL statements, by route.", [
+            ("", {"route": route}, repr(stats.query_seconds)) for route, stats in routes
+        ])
+        metric("db_connections_opened_total", "counter", "SQLite connections opened, by route.", [
+            ("", {"route": route}, stats.connections) for route, stats in routes
+        ])
+        metric("db_connect_seconds_total", "counter",
+               "Time spent opening connections and applying pragmas, by route.", [
+                   ("", {"route": route}, repr(stats.connect_seconds)) for route, stats in routes
+               ])
+
+    if caches:
+        cache_stats = sorted((name, cache.stats()) for name, cache in caches.items())
+        metric("cache_hits_total", "counter", "In-process cache hits.", [
+            ("", {"cache": name}, stats["hits"]) for name, stats in cache_stats
+        ])
+        metric("cache_misses_total", "counter", "In-process cache misses.", [
+            ("", {"cache": name}, stats["misses"]) for name, stats in cache_stats
+        ])
+        metric("cache_entries", "gauge", "Entries currently held by in-process caches.", [
+            ("", {"cache": name}, stats["size"]) for name, stats in cache_stats
+        ])
+    return "\n".join(out) + "\n"
@@ -0,0 +1,39 @@
+// Search box suggestions from /search/suggest, shown through a <datalist>.
+// Picking a suggestion opens that product or category.
+(function () {
+  var input = document.querySelector("input[data-suggest-url]");
+  if (!input) return;
+  var list = document.getElementById(input.getAttribute("list"));
+  var urls = {};
+  var timer = null;
+  var latest = "";
+
+  function show(suggestions) {
+    urls = {};
+    list.innerHTML = "";
+    suggestions.forEach(function (s) {
+      var option = document.createElement("option");
+      option.value = s.name;
+      if (s.type === "category") option.label = "Category";
+      urls[s.name] = s.url;
+      list.appendChild(option);
+    });
+  }
+
+  input.addEventListener("input", function () {
+    var q = input.value.trim();
+    if (urls[input.value]) {
+      window.location = urls[input.value];
+      return;
+    }
+    clearTimeout(timer);
+    if (!q) return show([]);
+    timer = setTimeout(function () {
+      latest = q;
+      fetch(input.dataset.suggestUrl + "?q=" + encodeURIComponent(q))
+        .then(function (r) { return r.json(); })
+        .then(function (data) { if (data.q === latest) show(data.suggestions); })
+        .catch(function () {});
+    }, 120);
+  });
+})();
@@ -0,0 +1,151 @@
+import bisect
+import re
+import threading
+import time
+
+from db.db import catalog_names, close_db_connection, get_catalog_version, on_catalog_change
+
+# As-you-type search suggestions (/search/suggest?q=) from an in-memory
+# prefix index over product and category names: every word of every name
+# is an entry in one sorted list, so the names with a word starting with
+# the typed prefix are one bisect away and no SQL runs per keystroke.
+#
+# The index is built on first use and patched through on_catalog_change
+# for products written by this process (not for stock-only changes, which
+# leave names alone); bulk changes (None, None) mark it for a rebuild. Writes made by other processes are picked up by a rebuild
+# when the catalog version has moved, checked every REBUILD_AFTER seconds.
+# Only the first build blocks a request; later ones run on a background
+# thread while queries keep using the old index.
+
+MAX_SUGGESTIONS = 8
+MAX_CANDIDATES = 500  # index entries looked at per query
+REBUILD_AFTER = 60.0
+
+
+def words(text):
+    return re.findall(r"\w+", text.casefold())
+
+
+class SuggestIndex:
+    def __init__(self):
+        self.builds = 0
+        self._entries = []  # sorted (word, kind, id)
+        self._names = {}    # (kind, id) -> (name, its words)
+        self._version = None
+        self._expires = 0.0
+        self._stale = True
+        self._lock = threading.Lock()      # guards _entries / _names
+        self._building = threading.Lock()
+
+    def suggest(self, query, limit=MAX_SUGGESTIONS):
+        # [{"type", "id", "name"}], categories first, then names starting
+        # with the query, then shorter names; repeated names are listed
+        # once. Every word of the query must start a word of the name; the
+        # longest one narrows the scan.
+        terms = words(query)
+        if not terms:
+            return []
+        self._refresh()
+        prefix = max(terms, key=len)
+        whole = " ".join(terms)
+        found = {}
+        with self._lock:
+            entries = self._entries
+            start = bisect.bisect_left(entries, (prefix,))
+            for i in range(start, min(start + MAX_CANDIDATES, len(entries))):
+                word, kind, item_id = entries[i]
+                if not word.startswith(prefix):
+                    break
+                if (kind, item_id) not in found:
+                    found[kind, item_id] = self._names[kind, item_id]
+        matches = []
+        for (kind, item_id), (name, name_words) in found.items():
+            if all(any(w.startswith(t) for w in name_words) for t in terms):
+                folded = " ".join(name_words)
+                rank = (kind != "category", not folded.startswith(whole), len(name), folded)
+                matches.append((rank, {"type": kind, "id": item_id, "name": name}))
+        matches.sort(key=lambda match: match[0])
+        suggestions, seen = [], set()
+        for _, item in matches:
+            if (item["type"], item["name"]) not in seen:
+                seen.add((item["type"], item["name"]))
+                suggestions.append(item)
+                if len(suggestions) == limit:
+                    break
+        return suggestions
+
+    def patch(self, product_ids, category_ids):
+        # on_catalog_change listener
+        if product_ids is None:
+            self._stale = True
+            return
+        if self._version is None:
+            return  # not built yet
+        rows = catalog_names(product_ids, category_ids)
+        with self._lock:
+            for key in [("product", i) for i in product_ids] + [("category", i) for i in category_ids]:
+                self._remove(*key)
+            for kind, item_id, name in rows:
+                self._add(kind, item_id, name)
+
+    def _add(self, kind, item_id, name):
+        name_words = tuple(words(name))
+        self._names[kind, item_id] = (name, name_words)
+        for word in set(name_words):
+            bisect.insort(self._entries, (word, kind, item_id))
+
+    def _remove(self, kind, item_id):
+        name, name_words = self._names.pop((kind, item_id), (None, ()))
+        for word in set(name_words):
+            i = bisect.bisect_left(self._entries, (word, kind, item_id))
+            if i < len(self._entries) and self._entries[i] == (word, kind, item_id):
+                del self._entries[i]
+
+    def _refresh(self):
+        now = time.monotonic()
+        if not (self._stale or now >= self._expires):
+            return
+        if self._version is None:
+            with self._building:  # the first build blocks
+                if self._version is None:
+                    self._check(now)
+        elif self._building.acquire(blocking=False):
+            # Later ones run in the background on the old index
+            threading.Thread(target=self._check_in_background, args=(now,), daemon=True).start()
+
+    def _check_in_background(self, now):
+        try:
+            self._check(now)
+        finally:
+            self._building.release()
+            close_db_connection()
+
+    def _check(self, now):
+        self._expires = now + REBUILD_AFTER
+        version = get_catalog_version()[0]
+        if self._stale or version != self._version:
+            self._stale = False
+            self.rebuild(version)
+
+    def rebuild(self, version=None):
+        entries, names = [], {}
+        for kind, item_id, name in catalog_names():
+            name_words = tuple(words(name))
+            names[kind, item_id] = (name, name_words)
+            entries.extend((word, kind, item_id) for word in set(name_words))
+        entries.sort()
+        with self._lock:
+            self._entries, self._names = entries, names
+        self._version = version if version is not None else get_catalog_version()[0]
+        self.builds += 1
+
+    def stats(self):
+        return {"entries": len(self._entries), "names": len(self._names), "builds": self.builds}
+
+
+index = SuggestIndex()
+on_catalog_change(index.patch, stock=False)
+
+
+def suggest(query, limit=MAX_SUGGESTIONS):
+    return index.suggest(query, limit)
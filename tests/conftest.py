@@ -0,0 +1,75 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# db.db and db.migrate read STUDENTMART_DB on import (app.py also migrates
+# it): point them at a scratch file before any test imports them, so
+# db/database.db is never touched
+os.environ["STUDENTMART_DB"] = os.path.join(tempfile.mkdtemp(prefix="studentmart-tests-"), "app.db")
+os.environ.setdefault("STUDENTMART_HASH_METHOD", "pbkdf2:sha256:1000")
+os.environ.setdefault("STUDENTMART_JINJA_CACHE", "")
+
+from bench.common import create_schema  # noqa: E402  (after STUDENTMART_DB is set)
+
+create_schema(os.environ["STUDENTMART_DB"])  # app.py migrates it on import
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    # A fresh database (schema.sql + every migration) for one test; yields
+    # db.db pointed at it
+    from db import db
+
+    path = str(tmp_path / "test.db")
+    create_schema(path)
+    monkeypatch.setattr(db, "DB_PATH", path)
+    db.catalog_cache.clear()
+    yield db
+    db.close_db_connection()
+    db.catalog_cache.clear()
+
+
+@pytest.fixture
+def snapshot(database, monkeypatch):
+    # STUDENTMART_CATALOG_SNAPSHOT=1 for one test, counters checked on
+    # every read
+    snapshot = database.CatalogSnapshot(enabled=True, check_interval=0)
+    monkeypatch.setattr(database, "catalog_snapshot", snapshot)
+    yield snapshot
+    if snapshot._current is not None:
+        snapshot._current[2].close()
+
+
+@pytest.fixture
+def client(database):
+    # Flask test client on the test database, CSRF checks off, empty page cache
+    from app import app, page_cache
+
+    app.config["WTF_CSRF_ENABLED"] = False
+    page_cache.clear()
+    yield app.test_client()
+    page_cache.clear()
+
+
+def login(client, user_id):
+    with client.session_transaction() as session:
+        session["user_id"] = user_id
+
+
+def add_catalog(db, products=6):
+    # An admin, a shopper, two categories and some products; returns
+    # (admin id, shopper id, category ids, product ids)
+    categories = list(db.resolve_categories(("Food", "Kitchen"), create_missing=True).values())
+    db.create_user("admin", "pw")
+    db.create_user("shopper", "pw")
+    admin = db.get_user_by_username("admin")["id"]
+    shopper = db.get_user_by_username("shopper")["id"]
+    for i in range(products):
+        db.create_product(admin, categories[i % 2], f"Product {i}", "", 3.0 + i * 10, "", 5)
+    products = sorted(row["id"] for row in db.get_all_products())
+    return admin, shopper, categories, products
@@ -0,0 +1,81 @@
+import gzip
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+from werkzeug.http import http_date
+
+from app import API_GZIP_MIN_BYTES
+
+from conftest import add_catalog
+
+
+def set_last_changed(database, when):
+    conn = sqlite3.connect(database.DB_PATH)
+    conn.execute("UPDATE change_counters SET changed = ? WHERE name IN ('catalog', 'stock')",
+                 (when.strftime("%Y-%m-%d %H:%M:%S"),))
+    conn.commit()
+    conn.close()
+
+
+def test_fields_selects_columns(database, client):
+    _, _, _, products = add_catalog(database)
+    items = client.get("/api/products?fields=name,price").get_json()["items"]
+    assert len(items) == len(products)
+    assert all(set(item) == {"name", "price"} for item in items)
+    item = client.get(f"/api/products/{products[0]}?fields=stock").get_json()
+    assert item == {"stock": 5}
+
+
+def test_unknown_field_is_a_400(database, client):
+    add_catalog(database)
+    response = client.get("/api/products?fields=name,password")
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "unknown field"
+
+
+def test_large_responses_are_gzipped(database, client):
+    add_catalog(database, products=20)
+    plain = client.get("/api/products?limit=20")
+    assert len(plain.get_data()) >= API_GZIP_MIN_BYTES
+    assert "Content-Encoding" not in plain.headers
+
+    zipped = client.get("/api/products?limit=20", headers={"Accept-Encoding": "gzip"})
+    assert zipped.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(zipped.get_data()) == plain.get_data()
+    assert zipped.headers["ETag"] != plain.headers["ETag"]
+
+    small = client.get("/api/categories", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in small.headers
+
+
+def test_if_none_match_gets_304(database, client):
+    _, _, categories, products = add_catalog(database)
+    etag = client.get("/api/products").headers["ETag"]
+    assert client.get("/api/products", headers={"If-None-Match": etag}).status_code == 304
+
+    product = database.get_product_by_id(products[0])
+    database.update_product(products[0], categories[0], "Renamed", "", product["price"], "",
+                            product["stock"])
+    assert client.get("/api/products", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_if_modified_since_gets_304(database, client):
+    add_catalog(database)
+    changed = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(minutes=5)
+    set_last_changed(database, changed)
+    response = client.get("/api/products")
+    assert response.headers["Last-Modified"] == http_date(changed)
+    headers = {"If-Modified-Since": response.headers["Last-Modified"]}
+    assert client.get("/api/products", headers=headers).status_code == 304
+
+
+def test_no_last_modified_for_a_change_in_the_current_second(database, client):
+    add_catalog(database)
+    # Stamped a second ahead so the test does not depend on the clock
+    # ticking over between the write and the request
+    set_last_changed(database, datetime.now(timezone.utc) + timedelta(seconds=1))
+    response = client.get("/api/products")
+    assert "Last-Modified" not in response.headers
+    # A date-only revalidation cannot be answered with a stale 304
+    headers = {"If-Modified-Since": http_date(datetime.now(timezone.utc))}
+    assert client.get("/api/products", headers=headers).status_code == 200
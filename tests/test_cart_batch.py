@@ -0,0 +1,71 @@
+from app import MAX_CART_OPERATIONS
+
+from conftest import add_catalog, login
+
+
+def cart(database, user_id):
+    return {row["product_id"]: row["quantity"] for row in database.cart_get_items(user_id)}
+
+
+def test_json_batch_applies_operations_in_order(database, client):
+    _, shopper, _, products = add_catalog(database)
+    a, b, c = products[:3]
+    database.cart_add_item(shopper, c, 4)
+    login(client, shopper)
+
+    response = client.post("/cart/batch/", json={"operations": [
+        {"op": "add", "product_id": a, "qty": 2},
+        {"op": "add", "product_id": a, "qty": 1},
+        {"op": "set", "product_id": b, "qty": 5},
+        {"op": "remove", "product_id": c},
+    ]})
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert {item["product_id"]: item["quantity"] for item in data["items"]} == {a: 3, b: 5}
+    assert data["total"] == round(sum(item["line_total"] for item in data["items"]), 2)
+    assert cart(database, shopper) == {a: 3, b: 5}
+
+
+def test_form_post_sets_quantities(database, client):
+    _, shopper, _, products = add_catalog(database)
+    a, b = products[:2]
+    database.cart_add_item(shopper, a, 1)
+    database.cart_add_item(shopper, b, 1)
+    login(client, shopper)
+
+    response = client.post("/cart/batch/", data={f"qty-{a}": "3", f"qty-{b}": "0"})
+
+    assert response.status_code == 200
+    assert "Cart updated." in response.get_data(as_text=True)
+    assert cart(database, shopper) == {a: 3}
+
+
+def test_unknown_product_rejects_the_whole_batch(database, client):
+    _, shopper, _, products = add_catalog(database)
+    database.cart_add_item(shopper, products[0], 1)
+    login(client, shopper)
+
+    response = client.post("/cart/batch/", json={"operations": [
+        {"op": "set", "product_id": products[0], "qty": 7},
+        {"op": "add", "product_id": products[1], "qty": 1},
+        {"op": "add", "product_id": 999_999, "qty": 1},
+    ]})
+
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "unknown product"}
+    assert cart(database, shopper) == {products[0]: 1}
+
+
+def test_too_many_operations_are_rejected(database, client):
+    _, shopper, _, products = add_catalog(database)
+    login(client, shopper)
+    operations = [{"op": "add", "product_id": products[0], "qty": 1}] * (MAX_CART_OPERATIONS + 1)
+
+    response = client.post("/cart/batch/", json={"operations": operations})
+
+    assert response.status_code == 400
+    assert cart(database, shopper) == {}
+    response = client.post("/cart/batch/", json={"operations": operations[:MAX_CART_OPERATIONS]})
+    assert response.status_code == 200
+    assert cart(database, shopper) == {products[0]: MAX_CART_OPERATIONS}
@@ -0,0 +1,52 @@
+from conftest import add_catalog
+
+
+def cached_keys(db):
+    return set(db.catalog_cache._data)
+
+
+def fill_cache(db, products, categories):
+    for product_id in products[:2]:
+        db.get_product_by_id(product_id)
+    db.get_all_products(limit=12)
+    for category_id in categories:
+        db.get_all_products(category_id=category_id, limit=12)
+    db.get_all_categories()
+
+
+def test_product_writes_drop_their_keys(database):
+    admin, _, categories, products = add_catalog(database)
+    categories.append(database.resolve_categories(("Books",), create_missing=True)["books"])
+    food, kitchen, books = categories
+    moved, other = products[0], products[1]  # Product 0 is in Food
+
+    database.catalog_cache.clear()
+    fill_cache(database, products, categories)
+    product = database.get_product_by_id(moved)
+    database.update_product(moved, kitchen, product["name"], product["description"],
+                            product["price"], product["image_url"], product["stock"])
+    assert cached_keys(database) == {("product", other), ("products", books, 12), ("categories",)}
+    assert database.get_product_by_id(moved)["category"] == kitchen
+
+    database.catalog_cache.clear()
+    fill_cache(database, products, categories)
+    database.delete_product(moved)
+    assert cached_keys(database) == {("product", other), ("products", food, 12),
+                                     ("products", books, 12), ("categories",)}
+    assert database.get_product_by_id(moved) is None
+
+
+def test_entries_expire_after_ttl(database):
+    cache = database.CatalogCache(ttl=0)
+    cache.set("key", "value")
+    assert cache.get("key") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_used_entry_is_evicted(database):
+    cache = database.CatalogCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.set("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
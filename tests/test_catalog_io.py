@@ -0,0 +1,63 @@
+import io
+import os
+import sqlite3
+import subprocess
+import sys
+
+from catalog_io import import_products
+
+from conftest import ROOT
+
+HEADER = "id,sku,name,description,price,stock,category,image_url\n"
+
+
+def add_user(path, username):
+    conn = sqlite3.connect(path)
+    cursor = conn.execute("INSERT INTO users (username, password) VALUES (?, 'x')", (username,))
+    conn.commit()
+    conn.close()
+    return cursor.lastrowid
+
+
+def test_cli_migrates_an_unmigrated_database(tmp_path):
+    path = str(tmp_path / "fresh.db")
+    conn = sqlite3.connect(path)
+    with open(os.path.join(ROOT, "db", "schema.sql"), encoding="utf-8") as f:
+        conn.executescript(f.read())
+    conn.close()
+    add_user(path, "admin")
+    supplier = tmp_path / "supplier.csv"
+    supplier.write_text(HEADER + ",SKU-1,Rice,,2.50,10,Groceries,\n", encoding="utf-8")
+
+    result = subprocess.run(
+        [sys.executable, "catalog_io.py", "import", str(supplier), "--create-categories"],
+        cwd=ROOT, env=dict(os.environ, STUDENTMART_DB=path), capture_output=True, text=True,
+    )
+
+    assert result.returncode == 0, result.stderr
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT sku, name FROM products").fetchall() == [("SKU-1", "Rice")]
+    conn.close()
+
+
+def test_import_does_not_update_other_users_products(database):
+    owner = add_user(database.DB_PATH, "owner")
+    other = add_user(database.DB_PATH, "other")
+    report = import_products(io.StringIO(HEADER + ",SKU-1,Rice,,2.50,10,Groceries,\n"),
+                             "csv", owner, create_categories=True)
+    assert report.written == 1
+    product_id = database.get_all_products()[0]["id"]
+
+    rows = (HEADER + f"{product_id},,Stolen rice,,0.01,,Groceries,\n"
+            + ",SKU-1,Stolen rice,,0.01,,Groceries,\n"
+            + ",SKU-2,Beans,,1.00,5,Groceries,\n")
+    report = import_products(io.StringIO(rows), "csv", other)
+
+    assert report.written == 1
+    assert [message for _, message in report.errors] == ["product belongs to another user"] * 2
+    product = database.get_product_by_id(product_id)
+    assert (product["name"], product["price"], product["user"]) == ("Rice", 2.5, owner)
+    report = import_products(io.StringIO(HEADER + f"{product_id},,Basmati rice,,3.00,,Groceries,\n"),
+                             "csv", owner)
+    assert report.written == 1 and not report.errors
+    assert database.get_product_by_id(product_id)["name"] == "Basmati rice"
@@ -0,0 +1,44 @@
+import sqlite3
+
+from conftest import add_catalog
+
+
+def write_file(path, sql, params=()):
+    # A write made by another process: nothing in this one is told
+    conn = sqlite3.connect(path)
+    conn.execute(sql, params)
+    conn.commit()
+    conn.close()
+
+
+def test_stock_changes_sync_stock_without_reloading(database, snapshot):
+    _, _, _, products = add_catalog(database)
+    database.catalog_cache.enabled = False
+    try:
+        assert database.get_product_by_id(products[0])["stock"] == 5
+        version = database.get_catalog_version()[0]
+        assert snapshot.loads == 1
+
+        write_file(database.DB_PATH, "UPDATE products SET stock = stock - 2 WHERE id = ?",
+                   (products[0],))
+
+        assert database.get_catalog_version()[0] == version
+        assert database.get_product_by_id(products[0])["stock"] == 3
+        assert (snapshot.loads, snapshot.stock_syncs) == (1, 1)
+
+        write_file(database.DB_PATH, "UPDATE products SET name = 'Renamed' WHERE id = ?",
+                   (products[1],))
+
+        assert database.get_product_by_id(products[1])["name"] == "Renamed"
+        assert snapshot.loads == 2
+    finally:
+        database.catalog_cache.enabled = True
+
+
+def test_checkout_does_not_move_the_catalog_counter(database):
+    _, shopper, _, products = add_catalog(database)
+    version, _ = database.get_catalog_version()
+    database.cart_add_item(shopper, products[0], 2)
+    database.order_create_from_cart(shopper)
+    assert database.get_catalog_version()[0] == version
+    assert database.get_catalog_last_changed() is not None
@@ -0,0 +1,58 @@
+import sqlite3
+import threading
+
+import pytest
+
+from conftest import add_catalog
+
+
+def test_checkout_refreshes_cached_category_listings(database):
+    _, shopper, categories, products = add_catalog(database)
+    listed = database.get_all_products(category_id=categories[0], limit=12)
+    assert {row["stock"] for row in listed} == {5}
+
+    database.cart_add_item(shopper, products[0], 2)
+    database.order_create_from_cart(shopper)
+
+    listed = database.get_all_products(category_id=categories[0], limit=12)
+    assert {row["id"]: row["stock"] for row in listed}[products[0]] == 3
+
+
+@pytest.mark.parametrize("group_commit", [False, True])
+def test_parallel_checkouts_never_oversell(database, monkeypatch, group_commit):
+    monkeypatch.setattr(database.write_queue, "enabled", group_commit)
+    _, _, _, products = add_catalog(database, products=1)
+    product_id, stock = products[0], 5
+    shoppers = []
+    for i in range(16):
+        database.create_user(f"buyer{i}", "pw")
+        shoppers.append(database.get_user_by_username(f"buyer{i}")["id"])
+        database.cart_add_item(shoppers[-1], product_id, 1)
+    database.close_db_connection()
+
+    start = threading.Barrier(len(shoppers))
+    outcomes = []
+
+    def checkout(user_id):
+        start.wait()
+        try:
+            outcomes.append("sold" if database.order_create_from_cart(user_id) else "empty")
+        except database.OutOfStockError:
+            outcomes.append("out of stock")
+        finally:
+            database.close_db_connection()
+
+    threads = [threading.Thread(target=checkout, args=(user_id,)) for user_id in shoppers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    conn = sqlite3.connect(database.DB_PATH)
+    remaining = conn.execute("SELECT stock FROM products WHERE id = ?", (product_id,)).fetchone()[0]
+    lines_sold = conn.execute("SELECT COALESCE(SUM(quantity), 0) FROM order_items").fetchone()[0]
+    conn.close()
+    assert len(outcomes) == len(shoppers)
+    assert remaining >= 0
+    assert lines_sold <= stock
+    assert lines_sold == outcomes.count("sold") == stock - remaining
@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+import images
+
+Image = pytest.importorskip("PIL.Image")
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    monkeypatch.setattr(images, "UPLOAD_FOLDER", str(tmp_path))
+    monkeypatch.setattr(images, "DERIVED_FOLDER", str(tmp_path / "derived"))
+    return tmp_path
+
+
+def webp_pixel(info, use="thumb"):
+    entry = next(e for e in info["variants"][use] if e["type"] == "image/webp")
+    name = entry["url"][len(images.DERIVED_URL):]
+    with Image.open(os.path.join(images.DERIVED_FOLDER, name)) as img:
+        return img.convert("RGB").getpixel((10, 10))
+
+
+def test_same_stem_uploads_get_their_own_variants(uploads):
+    Image.new("RGB", (800, 600), (255, 0, 0)).save(uploads / "x.jpg")
+    Image.new("RGB", (800, 600), (0, 0, 255)).save(uploads / "x.png")
+
+    red = images.generate_variants(images.UPLOAD_URL + "x.jpg")
+    blue = images.generate_variants(images.UPLOAD_URL + "x.png")
+
+    red_urls = {e["url"] for entries in red["variants"].values() for e in entries}
+    blue_urls = {e["url"] for entries in blue["variants"].values() for e in entries}
+    assert not red_urls & blue_urls
+    r, g, b = webp_pixel(red)
+    assert r > 200 and b < 50
+    r, g, b = webp_pixel(blue)
+    assert b > 200 and r < 50
@@ -0,0 +1,22 @@
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+LISTENERS = "import app; from db import db; print(len(db._query_listeners), len(db._open_listeners))"
+
+
+def listeners(**env):
+    environ = {k: v for k, v in os.environ.items() if not k.startswith("STUDENTMART_SLOW_QUERY")}
+    result = subprocess.run([sys.executable, "-c", LISTENERS], cwd=ROOT, capture_output=True,
+                            text=True, env=dict(environ, **env), check=True)
+    return tuple(int(n) for n in result.stdout.split())
+
+
+def test_disabled_metrics_leave_connections_uninstrumented(tmp_path):
+    log = str(tmp_path / "slow.log")
+    assert listeners(STUDENTMART_METRICS="0", STUDENTMART_SLOW_QUERY_LOG=log) == (0, 0)
+    assert listeners(STUDENTMART_METRICS="0", STUDENTMART_SLOW_QUERY_LOG=log,
+                     STUDENTMART_SLOW_QUERY_MS="100") == (1, 0)
+    assert listeners(STUDENTMART_METRICS="1", STUDENTMART_SLOW_QUERY_LOG=log)[0] >= 1
@@ -0,0 +1,73 @@
+from app import page_cache
+
+from conftest import add_catalog, login
+
+
+def test_anonymous_pages_are_cached(database, client):
+    add_catalog(database)
+    first = client.get("/products/")
+    hits = page_cache.hits
+    second = client.get("/products/")
+    assert page_cache.hits == hits + 1
+    assert second.get_data() == first.get_data()
+    assert second.headers["ETag"] == first.headers["ETag"]
+
+
+def test_logged_in_pages_are_never_cached_or_served_from_cache(database, client):
+    _, shopper, _, products = add_catalog(database)
+    url = f"/product/{products[0]}/"
+    assert "Login to add to cart" in client.get(url).get_data(as_text=True)
+    assert url + "?" in page_cache._data
+
+    login(client, shopper)
+    page_cache.clear()
+    body = client.get(url).get_data(as_text=True)
+    assert "Add to Cart" in body
+    assert url + "?" not in page_cache._data
+
+    client.get("/logout/")
+    client.get(url)  # cached anonymously again
+    login(client, shopper)
+    body = client.get(url).get_data(as_text=True)
+    assert "Add to Cart" in body and "Login to add to cart" not in body
+
+
+def test_pages_with_flash_messages_are_never_cached_or_served_from_cache(database, client):
+    add_catalog(database)
+    client.get("/products/")  # cached without a flash
+    with client.session_transaction() as session:
+        session["_flashes"] = [("info", "Flash for this visitor only")]
+    page_cache.clear()
+    assert "Flash for this visitor only" in client.get("/products/").get_data(as_text=True)
+    assert "/products/?" not in page_cache._data
+
+    client.get("/products/")  # cached, the flash is gone
+    with client.session_transaction() as session:
+        session["_flashes"] = [("info", "Another flash")]
+    assert "Another flash" in client.get("/products/").get_data(as_text=True)
+    assert "Another flash" not in client.get("/products/").get_data(as_text=True)
+
+
+def test_catalog_writes_invalidate_cached_pages(database, client):
+    _, _, categories, products = add_catalog(database)
+    url = f"/product/{products[0]}/"
+    client.get(url)
+    client.get("/products/")
+    assert {url + "?", "/products/?"} <= set(page_cache._data)
+
+    product = database.get_product_by_id(products[0])
+    database.update_product(products[0], categories[0], "Renamed product", "",
+                            product["price"], "", product["stock"])
+
+    assert not {url + "?", "/products/?"} & set(page_cache._data)
+    assert "Renamed product" in client.get(url).get_data(as_text=True)
+
+
+def test_if_none_match_gets_304(database, client):
+    add_catalog(database)
+    etag = client.get("/products/").headers["ETag"]
+    cached = client.get("/products/", headers={"If-None-Match": etag})
+    assert cached.status_code == 304 and not cached.get_data()
+    page_cache.clear()
+    rendered = client.get("/products/", headers={"If-None-Match": etag})
+    assert rendered.status_code == 304
@@ -0,0 +1,22 @@
+import pytest
+
+from conftest import add_catalog
+
+
+@pytest.mark.parametrize("use_snapshot", [False, True])
+def test_faceted_listing(database, request, client, use_snapshot):
+    if use_snapshot:
+        request.getfixturevalue("snapshot")
+    _, _, categories, products = add_catalog(database)  # prices 3, 13, 23, ..., 53
+
+    listed = database.get_all_products(limit=12, price_band=3)  # 20-50
+    assert sorted(row["price"] for row in listed) == [23.0, 33.0, 43.0]
+    listed = database.get_all_products(category_id=categories[0], limit=12, price_band=3)
+    assert sorted(row["price"] for row in listed) == [23.0, 43.0]
+    assert database.get_all_products(limit=12, price_band=5) == []
+
+    response = client.get("/products/?price=3&in_stock=1")
+    assert response.status_code == 200
+    body = response.get_data(as_text=True)
+    assert "3 products" in body
+    assert body.count("product-card") == 3
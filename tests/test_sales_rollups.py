@@ -0,0 +1,57 @@
+import random
+import sqlite3
+
+from db.migrate import rebuild_product_pairs, rebuild_sales_rollups
+
+ROLLUPS = {
+    "sales_daily": "day",
+    "sales_daily_product": "day, product_id",
+    "sales_daily_category": "day, category_id",
+    "product_pairs": "product_id, related_id",
+}
+
+
+def rollup_rows(conn):
+    rows = {}
+    for table, key in ROLLUPS.items():
+        rows[table] = [tuple(round(v, 6) if isinstance(v, float) else v for v in row)
+                       for row in conn.execute(f"SELECT * FROM {table} ORDER BY {key}")]
+    return rows
+
+
+def test_checkout_rollups_match_a_rebuild_after_recategorising(database):
+    rnd = random.Random(7)
+    categories = list(database.resolve_categories(("Food", "Kitchen", "Books"),
+                                                  create_missing=True).values())
+    database.create_user("admin", "pw")
+    shoppers = []
+    for i in range(5):
+        database.create_user(f"shopper{i}", "pw")
+        shoppers.append(database.get_user_by_username(f"shopper{i}")["id"])
+    admin = database.get_user_by_username("admin")["id"]
+    for i in range(12):
+        database.create_product(admin, rnd.choice(categories), f"Product {i}", "",
+                                round(rnd.uniform(1, 20), 2), "", 1000)
+    products = [row["id"] for row in database.get_all_products()]
+
+    for _ in range(40):
+        product = database.get_product_by_id(rnd.choice(products))
+        database.update_product(product["id"], rnd.choice(categories), product["name"],
+                                product["description"], round(rnd.uniform(1, 20), 2),
+                                product["image_url"], product["stock"])
+        user_id = rnd.choice(shoppers)
+        for product_id in rnd.sample(products, rnd.randint(1, 3)):
+            database.cart_add_item(user_id, product_id, rnd.randint(1, 3))
+        assert database.order_create_from_cart(user_id)
+    database.close_db_connection()
+
+    conn = sqlite3.connect(database.DB_PATH, isolation_level=None)
+    incremental = rollup_rows(conn)
+    assert incremental["sales_daily_category"]
+    conn.execute("BEGIN")
+    rebuild_sales_rollups(conn)
+    rebuild_product_pairs(conn)
+    rebuilt = rollup_rows(conn)
+    conn.execute("ROLLBACK")
+    conn.close()
+    assert incremental == rebuilt
@@ -0,0 +1,22 @@
+import suggest
+
+from conftest import add_catalog
+
+
+def test_stock_only_changes_do_not_patch_the_index(database, monkeypatch):
+    _, shopper, categories, products = add_catalog(database)
+    suggest.index.rebuild()
+    lookups = []
+    real_catalog_names = suggest.catalog_names
+    monkeypatch.setattr(suggest, "catalog_names",
+                        lambda *args: lookups.append(args) or real_catalog_names(*args))
+
+    database.cart_add_item(shopper, products[0], 1)
+    database.order_create_from_cart(shopper)
+    assert lookups == []
+
+    product = database.get_product_by_id(products[0])
+    database.update_product(products[0], categories[0], "Saffron strands", "",
+                            product["price"], "", product["stock"])
+    assert len(lookups) == 1
+    assert [s["name"] for s in suggest.suggest("saffron")] == ["Saffron strands"]
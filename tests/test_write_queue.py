@@ -0,0 +1,92 @@
+import threading
+import time
+
+import pytest
+
+from app import BUSY_MESSAGE
+
+from conftest import add_catalog, login
+
+
+def add_category(name, fail=False):
+    def write(conn):
+        conn.execute("INSERT INTO categories (name) VALUES (?)", (name,))
+        if fail:
+            raise ValueError(name)
+        return name
+    return write
+
+
+def run_in_thread(fn, results):
+    def target():
+        try:
+            results.append(fn())
+        except Exception as e:
+            results.append(e)
+    thread = threading.Thread(target=target)
+    thread.start()
+    return thread
+
+
+def test_a_failing_job_rolls_back_alone(database):
+    writer = database.GroupCommitWriter(enabled=True, batch=10, wait=0.3)
+    results = []
+    threads = [run_in_thread(lambda: writer.submit(add_category("Good 1")), results),
+               run_in_thread(lambda: writer.submit(add_category("Bad", fail=True)), results),
+               run_in_thread(lambda: writer.submit(add_category("Good 2")), results)]
+    for t in threads:
+        t.join()
+
+    assert writer.commits == 1 and writer.writes == 3  # one batch
+    assert sorted(r for r in results if isinstance(r, str)) == ["Good 1", "Good 2"]
+    assert [str(r) for r in results if isinstance(r, ValueError)] == ["Bad"]
+    names = {row["name"] for row in database.get_all_categories()}
+    assert {"Good 1", "Good 2"} <= names and "Bad" not in names
+
+
+@pytest.fixture
+def full_queue(database, monkeypatch):
+    # A writer stuck on one job with its one-slot queue taken, installed
+    # as db.write_queue
+    writer = database.GroupCommitWriter(enabled=True, wait=0, size=1)
+    started, release = threading.Event(), threading.Event()
+
+    def stuck(conn):
+        started.set()
+        release.wait(10)
+
+    results = []
+    threads = [run_in_thread(lambda: writer.submit(stuck), results)]
+    assert started.wait(5)
+    threads.append(run_in_thread(lambda: writer.submit(add_category("Queued")), results))
+    while writer.stats()["queued"] < 1:
+        time.sleep(0.01)
+    monkeypatch.setattr(database, "write_queue", writer)
+    yield writer
+    release.set()
+    for t in threads:
+        t.join()
+    assert results.count("Queued") == 1
+
+
+def test_a_full_queue_turns_writes_away(database, full_queue):
+    with pytest.raises(database.WriteQueueBusy):
+        full_queue.submit(add_category("Turned away"))
+
+
+def test_a_full_queue_is_a_503_or_a_flash(database, client, request):
+    _, shopper, _, products = add_catalog(database)
+    login(client, shopper)
+    request.getfixturevalue("full_queue")  # holds the write lock from here on
+
+    response = client.post("/cart/batch/", json={"operations": [
+        {"op": "add", "product_id": products[0], "qty": 1}]})
+    assert response.status_code == 503
+    assert response.get_json() == {"error": "busy, try again"}
+
+    response = client.post(f"/cart/add/{products[0]}/", data={"qty": "1"},
+                           headers={"Referer": "/products/"})
+    assert response.status_code == 302 and response.headers["Location"] == "/products/"
+    with client.session_transaction() as session:
+        assert ("warning", BUSY_MESSAGE) in session["_flashes"]
+    assert database.cart_get_items(shopper) == []